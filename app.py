@@ -1,58 +1,172 @@
-from flask import Flask, request, jsonify, send_file, render_template
-import music21 as m21
-import random
-from magenta.music import midi_io
+import base64
+import io
+import json
+from flask import Flask, Response, request, jsonify, send_file, render_template, url_for, abort
+from artifact_store import ArtifactStore
+from chord_batch import BATCH_FORMATS, midi_files, pack_batch, zip_stream
+from chord_engine import CHORD_TYPES, KEYS, MODES, diatonic_table, generate_chord_batch, generate_chords, new_seed
+from midi_analysis import analyze_midi, analyze_notes, format_analysis, notes_from_sequence
+from midi_writer import encode_midi
+from model_handle import ModelHandle
+from progression import ProgressionModel, generate_progression_batch
+from result_cache import ResultCache, cache_key
+from voice_leading import voice_lead, voice_lead_batch
 
 app = Flask(__name__)
 
-def create_harmonious_random_trumpet_chords():
+# Ergebnisse von /generate liegen pro Anfrage unter einer eigenen id und werden nach ARTIFACT_TTL Sekunden gelöscht
+ARTIFACT_DIR = 'generated'
+ARTIFACT_TTL = 3600
+MIDI_FILENAME = 'trumpet_output.mid'
+ANALYSIS_FILENAME = 'analysis_log.txt'
+
+artifacts = ArtifactStore(ARTIFACT_DIR, ttl=ARTIFACT_TTL)
+
+# Obergrenzen für /generate und /generate_batch; MAX_BATCH_CHORDS begrenzt count * length,
+# denn die Zufallszahlen einer Batch liegen auf einmal im Speicher (etwa 35 Bytes pro Akkord)
+MAX_BATCH_COUNT = 100000
+MAX_SCORE_LENGTH = 1024
+MAX_BATCH_CHORDS = 4000000
+
+# Fertige Ergebnisse (MIDI + Analyse) für Anfragen mit seed; gleiche Parameter überspringen
+# Generierung und Analyse. RESULT_CACHE_DIR = None hält den Cache nur im Speicher.
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_DIR = 'result_cache'
+RESULT_CACHE_MAX_DISK_BYTES = 512 * 1024 * 1024
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, directory=RESULT_CACHE_DIR,
+                           max_disk_bytes=RESULT_CACHE_MAX_DISK_BYTES)
+
+# Akkordfolgen-Modell für method=progression (python progression.py <midi_ordner> <modell.npz>);
+# wird beim ersten Gebrauch geladen und nach neuem Training neu geladen
+PROGRESSION_MODEL_PATH = 'progression_model.npz'
+GENERATION_METHODS = ('harmonious', 'progression')
+
+progression_model = ModelHandle(PROGRESSION_MODEL_PATH, loader=ProgressionModel.load)
+
+# 'voice_led' setzt die Akkorde mit minimaler Stimmbewegung in die Umfänge der drei Trompeten
+# (voice_leading.TRUMPET_RANGES), 'close' lässt die enge Lage aus der Generierung stehen
+VOICINGS = ('voice_led', 'close')
+
+# music21 wird erst beim Bau einer Partitur importiert, damit der Worker schnell
+# startet; preload() holt das für vorgewärmte Worker-Pools nach
+
+def create_harmonious_random_trumpet_chords(seed=None, key='C', mode='major'):
     """
     Erstellt eine Partitur mit zufälligen, harmonisch passenden dreistimmigen Akkorden für drei Trompeten.
+
+    Die Akkorde sind leitereigene Dreiklänge der Tonart (`key`, `mode`) in
+    Trompetenlage, mit minimaler Stimmbewegung gesetzt. Gleicher seed ergibt
+    dieselbe Partitur.
+    """
+    # Die Akkorde entstehen als Integer-Arrays aus vorberechneten Tabellen; music21-Objekte erst beim Bau der Partitur
+    return voice_lead(generate_chords(64, seed=seed, key=key, mode=mode), key).to_score('Trumpet')
+
+def parse_seed(value):
+    """
+    Seed aus einem Anfrageparameter: None wird zu einem neuen Seed, sonst eine nicht-negative Ganzzahl.
+
+    Aus JSON kommende bools und Zahlen mit Nachkommastellen ergeben einen
+    ValueError, statt still zu einem anderen seed zu werden.
+    """
+    if value is None or value == '':
+        return new_seed()
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError('seed must be an integer')
+    seed = int(value)
+    if seed < 0:
+        raise ValueError('seed must not be negative')
+    return seed
+
+def create_progression_trumpet_chords(seed=None, key='C', mode='major', length=64, model=None):
+    """
+    Akkordfolge für drei Trompeten aus dem trainierten ProgressionModel als ChordSequence.
+
+    Ohne `model` das aktuelle Modell von PROGRESSION_MODEL_PATH; wirft
+    FileNotFoundError, solange dort keins liegt.
+    """
+    if model is None:
+        model = progression_model.get()
+    return generate_progression_batch(model, 1, length=length, key=key, mode=mode, seed=seed)[0]
+
+def generate_midi_and_analysis(seed, length=64, key='C', mode='major', method='harmonious', voicing='voice_led',
+                               with_analysis=True, use_cache=True):
+    """
+    MIDI-Bytes und Analyse-Statistiken (dict oder None) für seed, Länge, Tonart, Methode und Voicing, wenn möglich
+    aus dem Cache.
+
+    Frisch erzeugte Akkorde werden direkt auf ihren Arrays analysiert; fehlt
+    einem Cache-Eintrag nur die Analyse, wird sie aus dem gespeicherten MIDI
+    nachgeholt.
     """
-    score = m21.stream.Score()
-    trumpet_parts = []
-    for _ in range(3):
-        trumpet_part = m21.stream.Part()
-        trumpet_part.append(m21.instrument.Trumpet())
-        trumpet_parts.append(trumpet_part)
-
-    key = m21.key.Key('C')
-    scale = key.getScale('major')
-    possible_notes = [note.nameWithOctave for note in scale.getPitches('C3', 'C6')]
-    possible_lengths = [1, 1.5, 2, 3]
-
-    for _ in range(64):
-        root_note = random.choice(possible_notes)
-        chord_type = random.choice(['major', 'minor'])
-        intervals = ['P1', 'M3', 'P5'] if chord_type == 'major' else ['P1', 'm3', 'P5']
-        chord_pitches = [m21.pitch.Pitch(root_note).transpose(m21.interval.Interval(interval)) for interval in intervals]
-        note_length = random.choice(possible_lengths)
-        for i, trumpet_part in enumerate(trumpet_parts):
-            note = m21.note.Note(chord_pitches[i], quarterLength=note_length)
-            trumpet_part.append(note)
-
-    for part in trumpet_parts:
-        score.append(part)
-
-    return score
-
-def save_score_as_midi(score, filename):
-    mf = m21.midi.translate.music21ObjectToMidiFile(score)
-    mf.open(filename, 'wb')
-    mf.write()
-    mf.close()
-    return filename
-
-def analyze_midi_with_magenta(midi_file):
-    midi_data = midi_io.midi_file_to_sequence_proto(midi_file)
-    total_notes = len(midi_data.notes)
-    analysis = f"Die Datei enthält {total_notes} Noten.\n"
-
-    for note in midi_data.notes[:10]:
-        analysis += f"Note: {note.pitch}, Startzeit: {note.start_time}, Dauer: {note.end_time - note.start_time}\n"
-
-    analysis += "Magenta-Analyse abgeschlossen."
-    return analysis
+    params = {'method': method, 'voicing': voicing, 'seed': seed, 'length': length, 'key': key, 'mode': mode}
+    model = None
+    if method == 'progression':
+        # Einmal pro Anfrage geholt, damit Cache-Schlüssel und Akkorde vom selben Modell stammen;
+        # nach neuem Training liefert derselbe seed andere Akkorde
+        model = progression_model.get()
+        params['model'] = model.digest()
+    entry = cache_key(**params)
+    parts = (result_cache.get(entry) if use_cache else None) or {}
+    missing = 'midi' not in parts or (with_analysis and 'statistics' not in parts)
+    if 'midi' not in parts:
+        if method == 'progression':
+            chords = create_progression_trumpet_chords(seed, key=key, mode=mode, length=length, model=model)
+        else:
+            chords = generate_chords(length, seed=seed, key=key, mode=mode)
+        if voicing == 'voice_led':
+            chords = voice_lead(chords, key)
+        parts['midi'] = encode_midi(chords)
+        if with_analysis:
+            parts['statistics'] = json.dumps(analyze_notes(notes_from_sequence(chords))).encode('utf-8')
+    if with_analysis and 'statistics' not in parts:
+        parts['statistics'] = json.dumps(analyze_midi_file(parts['midi'])).encode('utf-8')
+    if use_cache and missing:
+        result_cache.put(entry, parts)
+    statistics = json.loads(parts['statistics']) if 'statistics' in parts else None
+    return parts['midi'], statistics
+
+def create_trumpet_chord_batch(count, seed=None, key='C', length=64, vocabulary=None, start=0, mode=None,
+                               method='harmonious', voicing='voice_led'):
+    """
+    Erstellt `count` Akkordfolgen für drei Trompeten auf einmal als ChordBatch (Integer-Arrays).
+
+    Mit `mode` ('major'/'minor') nur leitereigene Dreiklänge der Tonart in
+    Trompetenlage, sonst Akkordtypen aus `vocabulary` über der Dur-Tonleiter.
+    method='progression' zieht alle Folgen gemeinsam aus dem ProgressionModel
+    (`vocabulary` spielt dann keine Rolle). voicing='voice_led' setzt jede
+    Folge mit minimaler Stimmbewegung in die Trompetenumfänge. Gleicher `seed`
+    mit gleichen Parametern ergibt dieselben Partituren; mit `start` lässt
+    sich eine große Batch in Teile zerlegen, die zusammen genau die ganze
+    Batch ergeben.
+    """
+    if method == 'progression':
+        model = progression_model.get()
+        batch = generate_progression_batch(model, count, length=length, key=key, mode=mode or 'major', seed=seed,
+                                           start=start)
+    else:
+        batch = generate_chord_batch(count, length=length, key=key, vocabulary=vocabulary, seed=seed, start=start,
+                                     mode=mode)
+    if voicing == 'voice_led':
+        batch = voice_lead_batch(batch, key)
+    return batch
+
+def analyze_midi_file(midi_file):
+    """
+    Analysiert eine MIDI-Datei (Pfad oder bereits kodierte Bytes) mit dem eigenen Parser.
+
+    Gibt die Statistiken von midi_analysis.analyze_notes zurück; als Text mit format_analysis.
+    """
+    if not isinstance(midi_file, bytes):
+        with open(midi_file, 'rb') as f:
+            midi_file = f.read()
+    return analyze_midi(midi_file)
+
+def preload():
+    """
+    Importiert music21 vorab, z. B. aus gunicorns post_worker_init-Hook.
+    """
+    import music21  # noqa: F401
 
 @app.route('/')
 def index():
@@ -60,27 +174,162 @@ def index():
 
 @app.route('/generate', methods=['POST'])
 def generate():
-    # Erstelle zufällige Akkorde
-    score = create_harmonious_random_trumpet_chords()
-    midi_filename = "trumpet_output.mid"
-    save_score_as_midi(score, midi_filename)
+    """
+    Erzeugt zufällige Akkorde für drei Trompeten.
+
+    Parameter (Query oder Formular): seed, length (Anzahl Akkorde), key
+    (Tonika, z. B. 'E-' oder 'Eb', Standard 'C'), mode ('major'/'minor') und
+    method: 'harmonious' (zufällige leitereigene Akkorde) oder 'progression'
+    (Akkordfolgen aus dem trainierten ProgressionModel), voicing: 'voice_led'
+    (Standard, minimale Stimmbewegung in den Trompetenumfängen) oder 'close'.
+    Mit seed ist das Ergebnis reproduzierbar und wird aus dem Ergebnis-Cache
+    bedient; der verwendete seed steht immer in der Antwort.
+
+    Mit ?format=midi kommt die MIDI-Datei direkt zurück, mit ?format=json
+    MIDI (base64), Analysetext und Statistiken in einer Antwort. Ohne format werden beide unter
+    einer eigenen id abgelegt und als Download-URLs zurückgegeben.
+    """
+    output_format = request.args.get('format')
+    if output_format not in (None, 'midi', 'json'):
+        return jsonify({'error': f'Unknown format: {output_format}'}), 400
+    try:
+        seed = parse_seed(request.values.get('seed'))
+        length = int(request.values.get('length', 64))
+    except ValueError:
+        return jsonify({'error': 'seed and length must be non-negative integers'}), 400
+    if not 1 <= length <= MAX_SCORE_LENGTH:
+        return jsonify({'error': f'length must be 1..{MAX_SCORE_LENGTH}'}), 400
+    key = request.values.get('key', 'C')
+    mode = request.values.get('mode', 'major')
+    method = request.values.get('method', 'harmonious')
+    if method not in GENERATION_METHODS:
+        return jsonify({'error': f'method must be one of {GENERATION_METHODS}'}), 400
+    voicing = request.values.get('voicing', 'voice_led')
+    if voicing not in VOICINGS:
+        return jsonify({'error': f'voicing must be one of {VOICINGS}'}), 400
+    try:
+        key = diatonic_table(key, mode).key
+    except ValueError as e:
+        return jsonify({'error': str(e), 'keys': [f'{tonic} {name}' for tonic, name in KEYS], 'modes': list(MODES)}), 400
+    # Zufällig gezogene Seeds kommen nicht wieder, dafür lohnt kein Cache-Eintrag
+    use_cache = request.values.get('seed', '') != ''
 
-    # Analysiere mit Magenta
-    analysis = analyze_midi_with_magenta(midi_filename)
+    # Erstelle zufällige Akkorde und kodiere sie direkt als MIDI, ohne music21-Partitur;
+    # die Analyse nur, wenn sie auch zurückgegeben wird
+    try:
+        midi_bytes, statistics = generate_midi_and_analysis(seed, length, key=key, mode=mode, method=method,
+                                                            voicing=voicing, with_analysis=output_format != 'midi',
+                                                            use_cache=use_cache)
+    except FileNotFoundError:
+        return jsonify({'error': 'No trained progression model available'}), 503
+    if output_format == 'midi':
+        return send_file(io.BytesIO(midi_bytes), mimetype='audio/midi', as_attachment=True,
+                         download_name=MIDI_FILENAME), 200, {'X-Seed': str(seed)}
 
-    # Speichere Analyse als Log
-    analysis_filename = "analysis_log.txt"
-    with open(analysis_filename, "w") as f:
-        f.write(analysis)
+    analysis = format_analysis(statistics)
+    if output_format == 'json':
+        return jsonify({
+            "seed": seed,
+            "key": key,
+            "mode": mode,
+            "method": method,
+            "voicing": voicing,
+            "midi_filename": MIDI_FILENAME,
+            "midi_base64": base64.b64encode(midi_bytes).decode('ascii'),
+            "analysis": analysis,
+            "statistics": statistics
+        })
 
+    # Speichere MIDI und Analyse-Log nur für diese Anfrage
+    artifact_id = artifacts.save({MIDI_FILENAME: midi_bytes, ANALYSIS_FILENAME: analysis.encode('utf-8')})
     return jsonify({
-        "midi_file": midi_filename,
-        "log_file": analysis_filename
+        "id": artifact_id,
+        "seed": seed,
+        "key": key,
+        "mode": mode,
+        "method": method,
+        "voicing": voicing,
+        "midi_file": url_for('download', artifact_id=artifact_id, filename=MIDI_FILENAME),
+        "log_file": url_for('download', artifact_id=artifact_id, filename=ANALYSIS_FILENAME),
+        "expires_in": ARTIFACT_TTL
     })
 
-@app.route('/download/<filename>')
-def download(filename):
-    return send_file(filename, as_attachment=True)
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """
+    Erzeugt viele Partituren in einem Aufruf.
+
+    Parameter (JSON oder Formular): count, seed, start, key, mode, method, voicing, length,
+    vocabulary (kommagetrennt oder Liste) und format: 'zip' streamt ein Archiv mit einer
+    MIDI-Datei pro Partitur, 'npz' liefert alle Partituren als gepackte Arrays.
+    """
+    params = request.get_json(silent=True)
+    if params is None:
+        params = request.values
+    elif not isinstance(params, dict):
+        return jsonify({'error': 'JSON body must be an object'}), 400
+    try:
+        count = int(params.get('count', 1))
+        start = int(params.get('start', 0))
+        length = int(params.get('length', 64))
+        seed = parse_seed(params.get('seed'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'count and length must be integers, seed a non-negative integer'}), 400
+    if not 1 <= count <= MAX_BATCH_COUNT or not 1 <= length <= MAX_SCORE_LENGTH or start < 0:
+        return jsonify({'error': f'count must be 1..{MAX_BATCH_COUNT}, length 1..{MAX_SCORE_LENGTH} '
+                                 'and start not negative'}), 400
+    if count * length > MAX_BATCH_CHORDS:
+        return jsonify({'error': f'count * length must not exceed {MAX_BATCH_CHORDS} chords'}), 400
+    output_format = params.get('format', 'zip')
+    if output_format not in BATCH_FORMATS:
+        return jsonify({'error': f'format must be one of {BATCH_FORMATS}'}), 400
+    vocabulary = params.get('vocabulary')
+    if isinstance(vocabulary, str):
+        vocabulary = [name.strip() for name in vocabulary.split(',') if name.strip()]
+    is_name_list = isinstance(vocabulary, list) and all(isinstance(name, str) for name in vocabulary)
+    if vocabulary is not None and not is_name_list:
+        return jsonify({'error': 'vocabulary must be a list of chord type names',
+                        'chord_types': list(CHORD_TYPES)}), 400
+    key = params.get('key', 'C')
+    mode = params.get('mode') or None
+    method = params.get('method', 'harmonious')
+    voicing = params.get('voicing', 'voice_led')
+    # Aus JSON kann hier jeder Typ kommen; chord_engine erwartet Strings
+    if not all(isinstance(value, str) for value in (key, mode or '', method, voicing)):
+        return jsonify({'error': 'key, mode, method and voicing must be strings'}), 400
+    if method not in GENERATION_METHODS:
+        return jsonify({'error': f'method must be one of {GENERATION_METHODS}'}), 400
+    if voicing not in VOICINGS:
+        return jsonify({'error': f'voicing must be one of {VOICINGS}'}), 400
+
+    # Der verwendete seed steht im Header X-Seed, damit sich die Batch wiederholen lässt
+    try:
+        batch = create_trumpet_chord_batch(count, seed=seed, key=key, length=length, vocabulary=vocabulary,
+                                           start=start, mode=mode, method=method, voicing=voicing)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'chord_types': list(CHORD_TYPES)}), 400
+    except FileNotFoundError:
+        return jsonify({'error': 'No trained progression model available'}), 503
+
+    headers = {'X-Seed': str(seed)}
+    if output_format == 'npz':
+        data = pack_batch(batch, key=key, mode=mode or '', method=method, voicing=voicing,
+                          vocabulary=list(vocabulary or []), seed=str(seed), start=start)
+        return send_file(io.BytesIO(data), mimetype='application/octet-stream', as_attachment=True,
+                         download_name='trumpet_batch.npz'), 200, headers
+    headers['Content-Disposition'] = 'attachment; filename=trumpet_batch.zip'
+    return Response(zip_stream(midi_files(batch, first_index=start)), mimetype='application/zip', headers=headers)
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/download/<artifact_id>/<filename>')
+def download(artifact_id, filename):
+    path = artifacts.path(artifact_id, filename)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,85 @@
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+# Abstand in Sekunden, in dem abgelaufene Artefakte beim Speichern aufgeräumt werden
+CLEANUP_INTERVAL = 60.0
+
+_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ArtifactStore:
+    """
+    Ergebnisdateien einzelner Anfragen unter `directory/<id>/`, gelöscht nach `ttl` Sekunden.
+
+    Jede Anfrage bekommt eine eigene zufällige id, gleichzeitige Anfragen
+    überschreiben sich also nicht. Die Dateien werden in einem temporären
+    Ordner geschrieben und dann umbenannt, so dass /download nie halbe
+    Ergebnisse sieht. Da alles auf der Platte liegt, funktioniert der Download
+    auch über mehrere Worker-Prozesse hinweg.
+    """
+
+    def __init__(self, directory, ttl=3600):
+        # Absolut, weil Flasks send_file relative Pfade gegen das App-Verzeichnis auflöst
+        self.directory = os.path.abspath(directory)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cleaned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, files):
+        """Speichert {dateiname: bytes} unter einer neuen id und gibt die id zurück."""
+        self._cleanup_if_due()
+        artifact_id = uuid.uuid4().hex
+        final_dir = os.path.join(self.directory, artifact_id)
+        tmp_dir = final_dir + '.tmp'
+        os.makedirs(tmp_dir)
+        try:
+            for filename, data in files.items():
+                if os.path.basename(filename) != filename:
+                    raise ValueError(f'Invalid artifact file name: {filename!r}')
+                with open(os.path.join(tmp_dir, filename), 'wb') as f:
+                    f.write(data)
+            os.rename(tmp_dir, final_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return artifact_id
+
+    def path(self, artifact_id, filename):
+        """Pfad einer gespeicherten, noch gültigen Datei oder None."""
+        if not _ID_PATTERN.match(artifact_id) or os.path.basename(filename) != filename:
+            return None
+        artifact_dir = os.path.join(self.directory, artifact_id)
+        path = os.path.join(artifact_dir, filename)
+        try:
+            expired = time.time() - os.stat(artifact_dir).st_mtime > self.ttl
+        except FileNotFoundError:
+            return None
+        if expired or not os.path.isfile(path):
+            return None
+        return path
+
+    def _cleanup_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._cleaned_at < CLEANUP_INTERVAL:
+                return
+            self._cleaned_at = now
+        self.cleanup()
+
+    def cleanup(self):
+        """Löscht alle abgelaufenen Artefakte; gibt die Anzahl zurück."""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except FileNotFoundError:
+                pass  # Gleichzeitig von einem anderen Worker entfernt
+        return removed
@@ -0,0 +1,485 @@
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Optional
+
+import numpy as np
+
+# librosa and soundfile are imported inside the functions that use them, so
+# processes that only import the constants and FeatureConfig start quickly
+
+from feature_cache import FeatureCache, file_digest
+
+logger = logging.getLogger(__name__)
+
+# File extensions picked up when scanning a training folder
+AUDIO_EXTENSIONS = ('.mp3', '.wav')
+
+# Files handed to a pool worker per task; larger chunks mean less IPC overhead
+DEFAULT_CHUNKSIZE = 4
+
+# STFT parameters shared by all feature families (librosa's defaults)
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Feature vector layout: 13 MFCC + 12 chroma + 7 spectral contrast means
+N_MFCC = 13
+FEATURE_SIZE = N_MFCC + 12 + 7
+
+# Bump whenever extraction changes so cached vectors from older code are not reused
+FEATURE_VERSION = 1
+
+# Tracks longer than this are analysed block by block instead of loaded whole
+STREAM_MIN_SECONDS = 600
+
+# STFT frames per streamed block (~24 s at 44.1 kHz); bounds peak memory per worker
+STREAM_BLOCK_FRAMES = 2048
+
+# power_to_db clipping used by librosa.feature.mfcc's default path
+TOP_DB = 80.0
+
+# librosa.feature.spectral_contrast defaults
+CONTRAST_FMIN = 200.0
+CONTRAST_BANDS = 6
+CONTRAST_QUANTILE = 0.02
+
+# Bin layout for the streamed tuning estimate: residuals as in librosa.pitch_tuning
+# (resolution 0.01), piptrack magnitudes on a log10 grid to locate their median
+TUNING_BINS = np.linspace(-0.5, 0.5, 101)
+TUNING_MAG_EDGES = np.linspace(-20.0, 20.0, 4001)
+
+# Resamplers that can also run block by block (python-soxr's ResampleStream)
+STREAMING_RES_TYPES = ('soxr_vhq', 'soxr_hq', 'soxr_mq', 'soxr_lq', 'soxr_qq')
+
+
+@dataclass(frozen=True)
+class FeatureConfig:
+    """
+    How audio is decoded before feature extraction.
+
+    Audio is always downmixed to mono. sample_rate=None keeps the file's native
+    rate; otherwise it is resampled with `res_type` (any librosa.resample type).
+    `offset` and `max_duration` (seconds) restrict analysis to a window of the
+    track. The same config must be used for training and inference, so it is
+    saved next to every trained model.
+    """
+    sample_rate: int = 22050
+    res_type: str = 'soxr_qq'
+    offset: float = 0.0
+    max_duration: Optional[float] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def tag(self):
+        """Short stable hash of the settings, used to keep cached vectors apart."""
+        encoded = json.dumps(self.to_dict(), sort_keys=True).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest()[:12]
+
+
+DEFAULT_FEATURE_CONFIG = FeatureConfig()
+
+# Settings equivalent to the original librosa.load(audio_file, sr=None), assumed
+# for models saved before feature configs were recorded
+LEGACY_FEATURE_CONFIG = FeatureConfig(sample_rate=None, res_type='soxr_hq')
+
+
+def feature_config_path(model_path):
+    return model_path + '.features.json'
+
+
+def save_feature_config(config, model_path):
+    with open(feature_config_path(model_path), 'w') as f:
+        json.dump(config.to_dict(), f)
+
+
+def load_feature_config(model_path):
+    """Config a model was trained with; LEGACY_FEATURE_CONFIG if none was recorded."""
+    path = feature_config_path(model_path)
+    if not os.path.exists(path):
+        return LEGACY_FEATURE_CONFIG
+    with open(path, 'r') as f:
+        return FeatureConfig.from_dict(json.load(f))
+
+
+def feature_frames(y, sr):
+    """
+    Per-frame MFCC, chroma and spectral contrast from a single STFT of `y`.
+
+    librosa's mfcc/chroma_stft/spectral_contrast each run their own STFT when
+    given a signal; handing them the precomputed magnitude/power spectrogram
+    gives the same frames for a third of the transform cost.
+    """
+    import librosa
+
+    magnitude = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+    power = magnitude ** 2
+    mel = librosa.feature.melspectrogram(S=power, sr=sr)
+    mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=N_MFCC)
+    chroma = librosa.feature.chroma_stft(S=power, sr=sr)
+    spectral_contrast = librosa.feature.spectral_contrast(S=magnitude, sr=sr)
+    return mfcc, chroma, spectral_contrast
+
+
+def features_from_signal(y, sr):
+    mfcc, chroma, spectral_contrast = feature_frames(y, sr)
+    mfcc_mean = np.mean(mfcc.T, axis=0)
+    chroma_mean = np.mean(chroma.T, axis=0)
+    contrast_mean = np.mean(spectral_contrast.T, axis=0)
+    return np.hstack([mfcc_mean, chroma_mean, contrast_mean])
+
+
+def stream_spectrogram(audio_file, block_frames=STREAM_BLOCK_FRAMES, config=DEFAULT_FEATURE_CONFIG):
+    """
+    Yield (magnitude, sr) for consecutive blocks of STFT frames of `audio_file`.
+
+    Audio is decoded `block_frames` hops at a time, downmixed to mono and, if the
+    config asks for it, resampled with a streaming soxr resampler. The signal is
+    zero-padded by N_FFT // 2 on both ends and the overlap between blocks is
+    carried over, so the frames are the same as those of
+    librosa.stft(y, center=True) on the fully loaded signal.
+    """
+    import librosa
+    import soundfile as sf
+
+    pad = np.zeros(N_FFT // 2, dtype=np.float32)
+    _rewind(audio_file)
+    with sf.SoundFile(audio_file) as f:
+        native_sr = f.samplerate
+        sr = config.sample_rate or native_sr
+        # Same window arithmetic as librosa.load(offset=..., duration=...)
+        if config.offset:
+            f.seek(int(config.offset * native_sr))
+        frames = -1 if config.max_duration is None else int(config.max_duration * native_sr)
+        blocks = f.blocks(blocksize=block_frames * HOP_LENGTH, frames=frames, dtype='float32', always_2d=True)
+
+        samples = (block.mean(axis=1) for block in blocks)
+        if sr != native_sr:
+            samples = _resample_blocks(samples, native_sr, sr, config.res_type)
+
+        buffer = pad
+        for chunk in itertools.chain(samples, [pad]):
+            buffer = np.concatenate([buffer, chunk])
+            if len(buffer) < N_FFT:
+                continue
+            n_frames = 1 + (len(buffer) - N_FFT) // HOP_LENGTH
+            used = (n_frames - 1) * HOP_LENGTH + N_FFT
+            magnitude = np.abs(librosa.stft(buffer[:used], n_fft=N_FFT, hop_length=HOP_LENGTH, center=False))
+            yield magnitude, sr
+            buffer = buffer[n_frames * HOP_LENGTH:]
+
+
+def _resample_blocks(chunks, in_rate, out_rate, res_type):
+    import soxr
+
+    stream = soxr.ResampleStream(in_rate, out_rate, 1, dtype='float32', quality=res_type)
+    for chunk in chunks:
+        yield stream.resample_chunk(chunk)
+    yield stream.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def _contrast_peaks_valleys(magnitude, sr):
+    import librosa
+
+    # Band peaks and valleys as computed inside librosa.feature.spectral_contrast,
+    # which converts each to dB against its own maximum over the whole input
+    freq = librosa.fft_frequencies(sr=sr, n_fft=N_FFT)
+    octa = np.zeros(CONTRAST_BANDS + 2)
+    octa[1:] = CONTRAST_FMIN * (2.0 ** np.arange(0, CONTRAST_BANDS + 1))
+
+    valley = np.zeros((CONTRAST_BANDS + 1, magnitude.shape[1]))
+    peak = np.zeros_like(valley)
+    for k, (f_low, f_high) in enumerate(zip(octa[:-1], octa[1:])):
+        current_band = np.logical_and(freq >= f_low, freq <= f_high)
+        idx = np.flatnonzero(current_band)
+        if k > 0:
+            current_band[idx[0] - 1] = True
+        if k == CONTRAST_BANDS:
+            current_band[idx[-1] + 1:] = True
+
+        sub_band = magnitude[current_band, :]
+        if k < CONTRAST_BANDS:
+            sub_band = sub_band[:-1, :]
+
+        n = int(max(np.rint(CONTRAST_QUANTILE * np.sum(current_band)), 1))
+        sortedr = np.sort(sub_band, axis=0)
+        valley[k] = np.mean(sortedr[:n], axis=0)
+        peak[k] = np.mean(sortedr[-n:], axis=0)
+    return peak, valley
+
+
+def _db_floor(max_value):
+    # Lower clip applied by power_to_db(S, top_db=TOP_DB) when S.max() == max_value
+    return 10.0 * np.log10(max(1e-10, max_value)) - TOP_DB
+
+
+def _streamed_globals(audio_file, block_frames, config):
+    import librosa
+
+    # First pass: the track-wide quantities the per-frame features depend on,
+    # i.e. the maxima behind each power_to_db floor and chroma's tuning estimate
+    mel_max = peak_max = valley_max = 0.0
+    counts = np.zeros((len(TUNING_MAG_EDGES) + 1, len(TUNING_BINS) - 1), dtype=np.int64)
+    for magnitude, sr in stream_spectrogram(audio_file, block_frames, config):
+        power = magnitude ** 2
+        mel_max = max(mel_max, float(librosa.feature.melspectrogram(S=power, sr=sr).max(initial=0.0)))
+        peak, valley = _contrast_peaks_valleys(magnitude, sr)
+        peak_max = max(peak_max, float(peak.max(initial=0.0)))
+        valley_max = max(valley_max, float(valley.max(initial=0.0)))
+
+        pitch, mag = librosa.piptrack(S=power, sr=sr, n_fft=N_FFT)
+        pitched = pitch > 0
+        if not pitched.any():
+            continue
+        residual = np.mod(12 * librosa.hz_to_octs(pitch[pitched]), 1.0)
+        residual[residual >= 0.5] -= 1.0
+        residual_bin = np.clip(np.searchsorted(TUNING_BINS, residual, side='right') - 1, 0, len(TUNING_BINS) - 2)
+        mag_bin = np.searchsorted(TUNING_MAG_EDGES, np.log10(np.maximum(mag[pitched], 1e-30)))
+        np.add.at(counts, (mag_bin, residual_bin), 1)
+
+    # estimate_tuning keeps pitches whose magnitude is at least the median
+    per_mag = counts.sum(axis=1)
+    tuning = 0.0
+    if per_mag.sum() > 0:
+        median_bin = np.searchsorted(np.cumsum(per_mag), (per_mag.sum() + 1) // 2)
+        tuning = float(TUNING_BINS[np.argmax(counts[median_bin:].sum(axis=0))])
+    return (_db_floor(mel_max), _db_floor(peak_max), _db_floor(valley_max)), tuning
+
+
+def extract_features_streaming(audio_file, block_frames=STREAM_BLOCK_FRAMES, config=DEFAULT_FEATURE_CONFIG):
+    """
+    Mean-pooled feature vector of `audio_file` with memory bounded by `block_frames`.
+
+    Decodes the file twice: once for the track-wide dB floors and tuning, once to
+    accumulate running sums of MFCC, chroma and spectral contrast frames. The
+    result matches extract_features up to float rounding; the tuning estimate
+    can only differ if pitches straddle the median magnitude bin.
+    """
+    import librosa
+
+    (mel_floor, peak_floor, valley_floor), tuning = _streamed_globals(audio_file, block_frames, config)
+
+    totals = np.zeros(FEATURE_SIZE, dtype=np.float64)
+    n_frames = 0
+    for magnitude, sr in stream_spectrogram(audio_file, block_frames, config):
+        power = magnitude ** 2
+        mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr), top_db=None)
+        mfcc = librosa.feature.mfcc(S=np.maximum(mel_db, mel_floor), n_mfcc=N_MFCC)
+        chroma = librosa.feature.chroma_stft(S=power, sr=sr, tuning=tuning)
+        peak, valley = _contrast_peaks_valleys(magnitude, sr)
+        spectral_contrast = (np.maximum(librosa.power_to_db(peak, top_db=None), peak_floor)
+                             - np.maximum(librosa.power_to_db(valley, top_db=None), valley_floor))
+        totals += np.concatenate([mfcc.sum(axis=1), chroma.sum(axis=1), spectral_contrast.sum(axis=1)])
+        n_frames += magnitude.shape[1]
+
+    return (totals / max(n_frames, 1)).astype(np.float32)
+
+
+def _rewind(audio_file):
+    # extract_features also accepts in-memory file objects, which are read more than once
+    if hasattr(audio_file, 'seek'):
+        audio_file.seek(0)
+
+
+def _analysed_duration(audio_file, config):
+    import soundfile as sf
+
+    _rewind(audio_file)
+    try:
+        duration = sf.info(audio_file).duration
+    except Exception:
+        # Not readable by soundfile (e.g. some mp3 builds): use the in-memory path
+        return None
+    duration = max(duration - config.offset, 0.0)
+    if config.max_duration is not None:
+        duration = min(duration, config.max_duration)
+    return duration
+
+
+def _can_stream(config):
+    return config.sample_rate is None or config.res_type in STREAMING_RES_TYPES
+
+
+def load_audio(audio_file, config=DEFAULT_FEATURE_CONFIG):
+    """Decode `audio_file` into a mono float32 signal as described by `config`."""
+    import librosa
+
+    _rewind(audio_file)
+    return librosa.load(audio_file, sr=config.sample_rate, mono=True, offset=config.offset,
+                        duration=config.max_duration, res_type=config.res_type)
+
+
+# Function to extract features from audio (a path or a seekable file object)
+def extract_features(audio_file, config=DEFAULT_FEATURE_CONFIG):
+    duration = _analysed_duration(audio_file, config)
+    if duration is not None and duration > STREAM_MIN_SECONDS and _can_stream(config):
+        return extract_features_streaming(audio_file, config=config)
+    y, sr = load_audio(audio_file, config)
+    return features_from_signal(y, sr)
+
+
+def extract_features_from_bytes(data, config=DEFAULT_FEATURE_CONFIG, suffix=''):
+    """
+    extract_features for an encoded audio file held in memory.
+
+    soundfile decodes straight from memory. Formats it cannot read (e.g. mp3 on
+    older libsndfile) go through librosa's audioread fallback, which only opens
+    paths, so those are spooled to a temporary file named with `suffix`.
+    """
+    import soundfile as sf
+
+    buffer = io.BytesIO(data)
+    try:
+        sf.info(buffer)
+    except Exception:
+        fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            return extract_features(tmp_path, config)
+        finally:
+            os.remove(tmp_path)
+    return extract_features(buffer, config)
+
+
+def open_feature_cache(directory, max_bytes=64 * 1024 * 1024):
+    """FeatureCache sized for this module's feature vectors and tagged with FEATURE_VERSION."""
+    return FeatureCache(directory, FEATURE_SIZE, max_bytes=max_bytes, version=FEATURE_VERSION)
+
+
+def list_audio_files(directory):
+    """Audio files in `directory` (extension matched case-insensitively, like zip_ingest), in a stable order."""
+    return [
+        os.path.join(directory, file_name)
+        for file_name in sorted(os.listdir(directory))
+        if file_name.lower().endswith(AUDIO_EXTENSIONS)
+    ]
+
+
+def _extract_or_error(file_path, config=DEFAULT_FEATURE_CONFIG):
+    # Runs inside pool workers: exceptions are returned, not raised, so one bad
+    # file does not abort the whole map
+    try:
+        return extract_features(file_path, config), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+def _run_extraction(file_paths, workers, chunksize, config, on_result=None):
+    # (vector, error) per path, in input order
+    extract = partial(_extract_or_error, config=config)
+    if workers <= 1 or len(file_paths) <= 1:
+        return _consume(map(extract, file_paths), on_result)
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        return _consume(executor.map(extract, file_paths, chunksize=chunksize), on_result)
+    finally:
+        # If on_result raised (e.g. a cancelled job), drop the files not yet started
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _consume(results, on_result):
+    collected = []
+    for result in results:
+        collected.append(result)
+        if on_result is not None:
+            on_result()
+    return collected
+
+
+def extract_files(file_paths, workers=1, chunksize=DEFAULT_CHUNKSIZE, cache=None, config=DEFAULT_FEATURE_CONFIG,
+                  progress=None):
+    """
+    Extract features for `file_paths`, optionally on a process pool.
+
+    Returns (paths, features, errors): the successfully processed paths and their
+    feature vectors in input order, plus a list of (path, message) for failures.
+    workers=None uses one process per CPU; workers=1 runs in-process.
+
+    With a FeatureCache, files whose content was seen before are served from it
+    and only the misses are decoded; new vectors are added to the cache.
+
+    `progress(done, total)` is called after every file; an exception raised from
+    it aborts the extraction.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    total = len(file_paths)
+    done = 0
+
+    def report():
+        nonlocal done
+        done += 1
+        if progress is not None:
+            progress(done, total)
+
+    if cache is None:
+        return _collect(file_paths, _run_extraction(file_paths, workers, chunksize, config, report))
+
+    results = [None] * len(file_paths)
+    pending = []
+    for i, file_path in enumerate(file_paths):
+        try:
+            key = cache.key_for(file_digest(file_path), config.tag())
+        except OSError as e:
+            results[i] = (None, f'{type(e).__name__}: {e}')
+            report()
+            continue
+        vector = cache.get(key)
+        if vector is not None:
+            results[i] = (vector, None)
+            report()
+        else:
+            pending.append((i, key))
+
+    extracted = _run_extraction([file_paths[i] for i, _ in pending], workers, chunksize, config, report)
+    for (i, key), (vector, error) in zip(pending, extracted):
+        if error is None:
+            cache.put(key, vector)
+        results[i] = (vector, error)
+
+    return _collect(file_paths, results)
+
+
+def _collect(file_paths, results):
+    paths = []
+    features = []
+    errors = []
+    for file_path, (vector, error) in zip(file_paths, results):
+        if error is None:
+            paths.append(file_path)
+            features.append(vector)
+        else:
+            logger.warning('Error processing file %s: %s', file_path, error)
+            errors.append((file_path, error))
+    return paths, features, errors
+
+
+# Process data from directory
+def process_directory(directory, label, workers=1, chunksize=DEFAULT_CHUNKSIZE, errors=None, cache=None,
+                      config=DEFAULT_FEATURE_CONFIG, progress=None):
+    """
+    Extract features for every audio file in `directory` and label them all with `label`.
+
+    Failed files are skipped; pass a list as `errors` to receive (path, message)
+    pairs for them.
+    """
+    _, features, failed = extract_files(list_audio_files(directory), workers=workers,
+                                        chunksize=chunksize, cache=cache, config=config, progress=progress)
+    if errors is not None:
+        errors.extend(failed)
+    labels = [label] * len(features)
+    return features, labels
@@ -0,0 +1,444 @@
+"""
+Micro-benchmarks for the audio and generation pipelines.
+
+Usage:
+    python benchmarks.py process_directory <audio_folder> [max_workers]
+    python benchmarks.py extract_features <audio_file> [repeats]
+    python benchmarks.py streaming [audio_file]
+    python benchmarks.py classifier <model.h5> [n_rows]
+    python benchmarks.py startup [module ...]
+    python benchmarks.py chords [seconds]
+    python benchmarks.py batch [count] [workers]
+    python benchmarks.py analysis [seconds]
+    python benchmarks.py midi_features <midi_folder> [workers]
+    python benchmarks.py keys [seconds]
+    python benchmarks.py progressions [midi_folder] [count]
+    python benchmarks.py voice_leading [length]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_process_directory(directory, max_workers=None):
+    """Feature extraction time for `directory` with 1, 2, 4, ... up to max_workers processes."""
+    from audio_features import extract_files, list_audio_files
+
+    max_workers = max_workers or os.cpu_count() or 1
+    file_paths = list_audio_files(directory)
+    print(f"{len(file_paths)} files in {directory}")
+
+    worker_counts = []
+    workers = 1
+    while workers < max_workers:
+        worker_counts.append(workers)
+        workers *= 2
+    worker_counts.append(max_workers)
+
+    baseline = None
+    for workers in worker_counts:
+        elapsed, (paths, _, errors) = _timed(extract_files, file_paths, workers=workers)
+        baseline = baseline or elapsed
+        print(f"workers={workers:3d}  {elapsed:8.2f}s  speedup={baseline / elapsed:5.2f}x  "
+              f"ok={len(paths)} failed={len(errors)}")
+
+
+def _extract_features_separate_stft(y, sr):
+    # Previous extract_features body: every feature family runs its own STFT
+    import numpy as np
+    import librosa
+
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+    spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
+    return np.hstack([np.mean(mfcc.T, axis=0), np.mean(chroma.T, axis=0), np.mean(spectral_contrast.T, axis=0)])
+
+
+def bench_extract_features(audio_file, repeats=5):
+    """Per-track feature time with separate STFTs vs. the shared spectrogram; fails if the features differ."""
+    import numpy as np
+    import librosa
+    from audio_features import features_from_signal
+
+    y, sr = librosa.load(audio_file, sr=None)
+    print(f"{audio_file}: {len(y) / sr:.1f}s @ {sr} Hz")
+
+    for name, fn in (('separate STFTs', _extract_features_separate_stft), ('shared STFT', features_from_signal)):
+        times = [_timed(fn, y, sr)[0] for _ in range(repeats)]
+        print(f"{name:15s} best={min(times) * 1000:8.1f}ms  mean={sum(times) / len(times) * 1000:8.1f}ms")
+
+    before = _extract_features_separate_stft(y, sr)
+    after = features_from_signal(y, sr)
+    print(f"shape={after.shape}  max_abs_diff={np.max(np.abs(before - after)):.3e}")
+    np.testing.assert_allclose(after, before, rtol=1e-5, atol=1e-4, err_msg='shared STFT features diverge')
+
+
+def _write_synthetic_track(path, seconds, sr=44100):
+    # A stepped two-partial melody over noise with a slow crescendo, so tuning, chroma
+    # and the track-wide dB floors all have something to work on
+    import numpy as np
+    import soundfile as sf
+
+    t = np.arange(int(seconds * sr)) / sr
+    phase = 2 * np.pi * np.cumsum(220.0 * 2 ** (np.floor(t / 7) % 12 / 12)) / sr
+    noise = np.random.default_rng(0).standard_normal(len(t))
+    y = (0.3 * np.sin(phase) + 0.1 * np.sin(3 * phase) + 0.02 * noise) * np.linspace(0.2, 1.0, len(t))
+    sf.write(path, y.astype(np.float32), sr, subtype='FLOAT')
+
+
+def bench_streaming(audio_file=None):
+    """
+    Time and peak traced memory of in-memory vs. block-wise extraction; fails if the features differ.
+
+    Without `audio_file` a synthetic track just over STREAM_MIN_SECONDS is used,
+    i.e. one that extract_features would stream.
+    """
+    import tracemalloc
+    import numpy as np
+    from audio_features import STREAM_MIN_SECONDS, extract_features_streaming, features_from_signal, load_audio
+
+    def in_memory(path):
+        return features_from_signal(*load_audio(path))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if audio_file is None:
+            audio_file = os.path.join(tmp, 'synthetic.wav')
+            _write_synthetic_track(audio_file, STREAM_MIN_SECONDS + 10)
+
+        results = {}
+        for name, fn in (('in-memory', in_memory), ('streaming', extract_features_streaming)):
+            tracemalloc.start()
+            elapsed, results[name] = _timed(fn, audio_file)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:10s} {elapsed:8.2f}s  peak={peak / 2 ** 20:8.1f} MiB")
+
+    diff = np.max(np.abs(results['in-memory'] - results['streaming']))
+    print(f"max_abs_diff={diff:.3e}")
+    np.testing.assert_allclose(results['streaming'], results['in-memory'], rtol=1e-4, atol=1e-4,
+                               err_msg='streamed features diverge from librosa on the whole signal')
+
+
+# Run in a fresh interpreter: time from start to the first prediction, and peak RSS
+# (VmHWM, since ru_maxrss carries over the parent's peak across fork)
+_COLD_START_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import numpy as np
+from classifier import NumpyModel, _load_keras_model
+loader = NumpyModel.load if sys.argv[1] == 'numpy' else _load_keras_model
+model = loader(sys.argv[2])
+model.predict_on_batch(np.zeros((1, int(sys.argv[3])), dtype=np.float32))
+elapsed = time.perf_counter() - start
+peak_kib = next(line.split()[1] for line in open('/proc/self/status') if line.startswith('VmHWM'))
+print(elapsed, peak_kib)
+"""
+
+
+def bench_classifier(model_path, n_rows=1000):
+    """Cold start to first prediction for Keras and the NumPy export; fails if their predictions differ."""
+    import numpy as np
+
+    from classifier import NumpyModel, _load_keras_model, export_numpy_model, export_path_for
+
+    keras_model = _load_keras_model(model_path)
+    export_path = export_path_for(model_path)
+    export_numpy_model(keras_model, export_path)
+    numpy_model = NumpyModel.load(export_path)
+
+    n_features = keras_model.input_shape[-1]
+    X = np.random.default_rng(0).normal(size=(n_rows, n_features)).astype(np.float32)
+    expected = np.asarray(keras_model.predict_on_batch(X))
+    actual = numpy_model.predict_on_batch(X)
+    print(f"{n_rows} rows  max_abs_diff={np.max(np.abs(expected - actual)):.3e}")
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5, err_msg='NumPy export diverges from Keras')
+
+    for name, fn in (('keras', keras_model.predict_on_batch), ('numpy', numpy_model.predict_on_batch)):
+        elapsed, _ = _timed(fn, X[:1])
+        print(f"{name:6s} single-row predict {elapsed * 1e3:8.3f}ms")
+
+    for name, path in (('keras', model_path), ('numpy', export_path)):
+        output = subprocess.run([sys.executable, '-c', _COLD_START_SCRIPT, name, path, str(n_features)],
+                                capture_output=True, text=True, check=True).stdout.split()
+        elapsed, max_rss = float(output[-2]), int(output[-1])
+        print(f"{name:6s} cold start {elapsed:8.2f}s  max_rss={max_rss / 1024:8.1f} MiB")
+
+
+# Imported in a fresh interpreter: import time, heavy modules pulled in, and the
+# time until the first request to `path` (a route that needs none of them) is answered
+_STARTUP_SCRIPT = """
+import importlib, sys, time
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter() - start
+heavy = [name for name in ('tensorflow', 'librosa', 'soundfile', 'music21', 'magenta') if name in sys.modules]
+module.app.test_client().get(sys.argv[2])
+print(imported, time.perf_counter() - start, ','.join(heavy) or '-')
+"""
+
+STARTUP_ROUTES = {'song_ai': '/list_keys', 'app': '/'}
+
+
+def bench_startup(modules=None):
+    """Cold `import <module>` and first-request latency of the Flask apps."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=repo)
+    for module in modules or list(STARTUP_ROUTES):
+        # Fresh working directory: the apps create their key database and caches on import
+        with tempfile.TemporaryDirectory() as cwd:
+            result = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT, module, STARTUP_ROUTES.get(module, '/')],
+                                    cwd=cwd, env=env, capture_output=True, text=True)
+        if result.returncode:
+            print(f"{module:8s} failed: {result.stderr.strip().splitlines()[-1]}")
+            continue
+        imported, first_request, heavy = result.stdout.split()[-3:]
+        print(f"{module:8s} import={float(imported):6.2f}s  first_request={float(first_request):6.2f}s  "
+              f"heavy_modules={heavy}")
+
+
+def _create_chords_music21():
+    # The previous app.create_harmonious_random_trumpet_chords, for comparison
+    import random
+
+    import music21 as m21
+
+    score = m21.stream.Score()
+    trumpet_parts = []
+    for _ in range(3):
+        trumpet_part = m21.stream.Part()
+        trumpet_part.append(m21.instrument.Trumpet())
+        trumpet_parts.append(trumpet_part)
+
+    key = m21.key.Key('C')
+    scale = key.getScale('major')
+    possible_notes = [note.nameWithOctave for note in scale.getPitches('C3', 'C6')]
+    possible_lengths = [1, 1.5, 2, 3]
+
+    for _ in range(64):
+        root_note = random.choice(possible_notes)
+        chord_type = random.choice(['major', 'minor'])
+        intervals = ['P1', 'M3', 'P5'] if chord_type == 'major' else ['P1', 'm3', 'P5']
+        chord_pitches = [m21.pitch.Pitch(root_note).transpose(m21.interval.Interval(interval)) for interval in intervals]
+        note_length = random.choice(possible_lengths)
+        for i, trumpet_part in enumerate(trumpet_parts):
+            trumpet_part.append(m21.note.Note(chord_pitches[i], quarterLength=note_length))
+
+    for part in trumpet_parts:
+        score.append(part)
+    return score
+
+
+def _rate(fn, seconds):
+    # Calls per second of fn() over roughly `seconds` of wall time
+    fn()
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def bench_chords(seconds=2.0):
+    """Generations per second: music21 per note, integer engine alone, and engine plus Score."""
+    from chord_engine import generate_chords
+
+    cases = (
+        ('music21', _create_chords_music21),
+        ('engine', lambda: generate_chords(64)),
+        ('engine+score', lambda: generate_chords(64).to_score()),
+    )
+    baseline = None
+    for name, fn in cases:
+        rate = _rate(fn, seconds)
+        baseline = baseline or rate
+        print(f"{name:13s} {rate:10.1f} generations/s  speedup={rate / baseline:7.1f}x")
+
+
+def bench_batch(count=10000, workers=None):
+    """Scores per second: one generate/encode per score versus the vectorized batch path, zip and npz."""
+    from chord_batch import midi_files, pack_batch, zip_stream
+    from chord_engine import generate_chord_batch, generate_chords
+    from midi_writer import encode_midi
+
+    n_single = min(count, 1000)
+    elapsed, _ = _timed(lambda: [encode_midi(generate_chords(64)) for _ in range(n_single)])
+    baseline = n_single / elapsed
+    print(f"per-score     {baseline:10.0f} scores/s")
+
+    elapsed, batch = _timed(generate_chord_batch, count, seed=0)
+    print(f"generate      {count / elapsed:10.0f} scores/s")
+    for name, fn in (
+        ('midi', lambda: list(midi_files(batch, workers=workers))),
+        ('zip', lambda: sum(len(block) for block in zip_stream(midi_files(batch, workers=workers)))),
+        ('npz', lambda: len(pack_batch(batch))),
+    ):
+        elapsed, _ = _timed(fn)
+        print(f"{name:13s} {count / elapsed:10.0f} scores/s  speedup={count / elapsed / baseline:6.1f}x")
+
+
+def _peak_memory(fn):
+    # Peak Python heap allocated during one call of fn(), in KiB
+    import tracemalloc
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def bench_analysis(seconds=2.0):
+    """Analyses per second and peak heap: magenta/pretty_midi parsing versus the native parser and array path."""
+    import io
+
+    from chord_engine import generate_chords
+    from midi_analysis import analyze_midi, analyze_notes, notes_from_sequence
+    from midi_writer import encode_midi
+
+    chords = generate_chords(64, seed=0)
+    data = encode_midi(chords)
+    cases = []
+    try:
+        from magenta.music import midi_io
+        cases.append(('magenta', lambda: len(midi_io.midi_to_sequence_proto(data).notes)))
+    except ImportError:
+        print("magenta not installed, skipped")
+    try:
+        import pretty_midi
+        # What midi_io.midi_to_sequence_proto parses with before building the NoteSequence
+        cases.append(('pretty_midi', lambda: sum(len(i.notes) for i in pretty_midi.PrettyMIDI(io.BytesIO(data)).instruments)))
+    except ImportError:
+        print("pretty_midi not installed, skipped")
+    cases.append(('native_bytes', lambda: analyze_midi(data)))
+    cases.append(('native_arrays', lambda: analyze_notes(notes_from_sequence(chords))))
+
+    baseline = None
+    for name, fn in cases:
+        rate = _rate(fn, seconds)
+        baseline = baseline or rate
+        print(f"{name:13s} {rate:10.1f} analyses/s  speedup={rate / baseline:7.1f}x  "
+              f"peak={_peak_memory(fn):8.1f} KiB")
+
+
+def bench_midi_features(directory, workers=None):
+    """Files per second: featurizing each file on its own versus packed chunks, in-process and on a pool."""
+    from midi_features import extract_midi_files, list_midi_files
+
+    file_paths = list_midi_files(directory)
+    baseline = None
+    for name, kwargs in (
+        ('per_file', {'workers': 1, 'chunksize': 1}),
+        ('packed', {'workers': 1}),
+        ('packed_pool', {'workers': workers}),
+    ):
+        elapsed, (paths, features, _) = _timed(extract_midi_files, file_paths, **kwargs)
+        rate = len(file_paths) / elapsed
+        baseline = baseline or rate
+        print(f"{name:13s} {rate:10.0f} files/s  speedup={rate / baseline:6.1f}x  matrix={features.shape}")
+
+
+def bench_keys(seconds=2.0):
+    """Generations per second in one fixed key versus a different one of the 24 keys on every call."""
+    import itertools
+
+    import chord_engine
+    from chord_engine import KEYS, _build_diatonic_table, generate_chord_batch, generate_chords
+
+    elapsed, _ = _timed(lambda: [_build_diatonic_table.__wrapped__(key, mode) for key, mode in KEYS])
+    print(f"tables        {elapsed * 1000:10.2f} ms for all {len(KEYS)} keys (paid once at import)")
+
+    for name, size, fn in (
+        ('score', 1, lambda key, mode: generate_chords(64, seed=0, key=key, mode=mode)),
+        ('batch', 1000, lambda key, mode: generate_chord_batch(1000, seed=0, key=key, mode=mode)),
+    ):
+        cycle = itertools.cycle(KEYS)
+        fixed = _rate(lambda: fn('C', 'major'), seconds)
+        rotating = _rate(lambda: fn(*next(cycle)), seconds)
+        print(f"{name:5s} fixed    {fixed * size:10.0f} scores/s")
+        print(f"{name:5s} rotating {rotating * size:10.0f} scores/s  ratio={rotating / fixed:5.2f}")
+    print(f"tables built during the run: {_build_diatonic_table.cache_info().misses - len(chord_engine.KEY_TABLES)}")
+
+
+def bench_progressions(directory=None, count=10000):
+    """Training files/s per n-gram order, model size, and sampled chords/s for `count` sequences of 64."""
+    from chord_engine import generate_chord_batch
+    from chord_batch import midi_files
+    from midi_features import list_midi_files
+    from progression import MAX_ORDER, generate_progression_batch, train_progression_model
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if directory is None:
+            # Synthetic corpus: diatonic scores in minor, written like /generate_batch does
+            directory = tmp
+            for name, data in midi_files(generate_chord_batch(2000, seed=0, key='A', mode='minor')):
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(data)
+        file_paths = list_midi_files(directory)
+
+        for order in range(1, MAX_ORDER + 1):
+            elapsed, (model, errors) = _timed(train_progression_model, file_paths, order=order, workers=None)
+            model_path = os.path.join(tmp, f'order{order}.npz')
+            model.save(model_path)
+            print(f"order {order}  train {len(file_paths) / elapsed:8.0f} files/s  errors={len(errors)}  "
+                  f"model={os.path.getsize(model_path) / 1024:7.1f} KiB")
+            elapsed, batch = _timed(generate_progression_batch, model, count, length=64, seed=0, mode='minor')
+            print(f"         sample {count * 64 / elapsed:10.0f} chords/s  ({count} x 64 in {elapsed * 1000:.0f} ms)")
+
+
+def bench_voice_leading(length=10000):
+    """
+    Candidate table build, one sequence of `length` chords, a 1000 x 64 and a
+    1024 x 640 batch with peak traced memory, and voice movement per chord.
+    """
+    import tracemalloc
+
+    from chord_engine import generate_chord_batch
+    from voice_leading import candidate_table, voice_lead_batch, voice_movement
+
+    elapsed, table = _timed(candidate_table.__wrapped__, 'C')
+    print(f"table     {elapsed * 1000:8.2f} ms  candidates/state={table.rows.shape[1]}  "
+          f"costs={table.costs.nbytes / 1024:.0f} KiB")
+
+    for count, size in ((1, length), (1000, 64), (1024, 640)):
+        batch = generate_chord_batch(count, length=size, seed=0, mode='major')
+        voice_lead_batch(batch)
+        tracemalloc.start()
+        elapsed, led = _timed(voice_lead_batch, batch)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{count:4d} x {size:<6d} {elapsed * 1000:8.2f} ms  {count * size / elapsed:10.0f} chords/s  "
+              f"peak={peak / 2 ** 20:7.1f} MiB")
+        print(f"    movement/chord {voice_movement(batch.pitches).sum() / (count * (size - 1)):6.2f} -> "
+              f"{voice_movement(led.pitches).sum() / (count * (size - 1)):6.2f} semitones")
+
+
+BENCHMARKS = {
+    'process_directory': lambda args: bench_process_directory(args[0], int(args[1]) if len(args) > 1 else None),
+    'extract_features': lambda args: bench_extract_features(args[0], int(args[1]) if len(args) > 1 else 5),
+    'streaming': lambda args: bench_streaming(args[0] if args else None),
+    'classifier': lambda args: bench_classifier(args[0], int(args[1]) if len(args) > 1 else 1000),
+    'startup': lambda args: bench_startup(args),
+    'chords': lambda args: bench_chords(float(args[0]) if args else 2.0),
+    'batch': lambda args: bench_batch(int(args[0]) if args else 10000, int(args[1]) if len(args) > 1 else None),
+    'analysis': lambda args: bench_analysis(float(args[0]) if args else 2.0),
+    'midi_features': lambda args: bench_midi_features(args[0], int(args[1]) if len(args) > 1 else None),
+    'keys': lambda args: bench_keys(float(args[0]) if args else 2.0),
+    'progressions': lambda args: bench_progressions(args[0] if args else None, int(args[1]) if len(args) > 1 else 10000),
+    'voice_leading': lambda args: bench_voice_leading(int(args[0]) if args else 10000),
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,99 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from chord_engine import DIVISIONS, ChordBatch
+from midi_writer import encode_midi_batch
+
+# Ab dieser Anzahl Partituren wird die MIDI-Kodierung auf mehrere Prozesse verteilt
+PARALLEL_MIN_SCORES = 2000
+
+# Partituren pro Arbeitspaket eines Prozesses
+ENCODE_CHUNK = 500
+
+BATCH_FORMATS = ('zip', 'npz')
+
+
+def midi_name(index):
+    return f'score_{index:06d}.mid'
+
+
+def _encode_chunk(pitches, steps, durations, start):
+    files = encode_midi_batch(ChordBatch(pitches=pitches, steps=steps, durations=durations))
+    return [(midi_name(start + i), data) for i, data in enumerate(files)]
+
+
+def midi_files(batch, workers=None, first_index=0):
+    """
+    (Dateiname, MIDI-Bytes) für jede Partitur der Batch, in Reihenfolge.
+
+    Die Dateinamen zählen ab `first_index`, passend zu generate_chord_batch(start=...).
+
+    Ab PARALLEL_MIN_SCORES Partituren kodieren bis zu `workers` Prozesse
+    (Standard: ein Prozess pro CPU) je ENCODE_CHUNK Partituren.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    starts = range(0, len(batch), ENCODE_CHUNK)
+    chunks = ((batch.pitches[s:s + ENCODE_CHUNK], batch.steps[s:s + ENCODE_CHUNK],
+               batch.durations[s:s + ENCODE_CHUNK], first_index + s) for s in starts)
+
+    if workers <= 1 or len(batch) < PARALLEL_MIN_SCORES:
+        for chunk in chunks:
+            yield from _encode_chunk(*chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Ergebnisse in Eingabereihenfolge; höchstens 2 * workers Pakete sind gleichzeitig unterwegs
+        pending = []
+        for chunk in chunks:
+            pending.append(executor.submit(_encode_chunk, *chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+class _StreamBuffer:
+    # Nicht-seekbares Schreibziel: ZipFile schreibt dann Data Descriptors und
+    # die geschriebenen Bytes können nach jedem Eintrag abgeholt werden
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def zip_stream(files):
+    """Erzeugt ein Zip-Archiv aus (Dateiname, Bytes)-Paaren stückweise, ohne es ganz im Speicher zu halten."""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield buffer.take()
+    yield buffer.take()
+
+
+def pack_batch(batch, **metadata):
+    """
+    Die ganze Batch als eine .npz-Datei (Bytes): pitches, steps, durations plus Metadaten.
+
+    Dauern stehen in `divisions` Einheiten pro Viertelnote.
+    """
+    buffer = io.BytesIO()
+    extra = {name: np.asarray(value) for name, value in metadata.items()}
+    np.savez_compressed(buffer, pitches=batch.pitches, steps=batch.steps, durations=batch.durations,
+                        divisions=np.asarray(DIVISIONS), **extra)
+    return buffer.getvalue()
@@ -0,0 +1,432 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+# Stammtöne C..B: Halbtonabstand zu C und Name
+STEP_SEMITONES = np.array([0, 2, 4, 5, 7, 9, 11], dtype=np.int16)
+STEP_NAMES = ('C', 'D', 'E', 'F', 'G', 'A', 'B')
+ACCIDENTALS = {-2: '--', -1: '-', 0: '', 1: '#', 2: '##'}
+
+# Akkordtypen als Halbton- und Stammtonabstände zum Grundton (Grundton, Terz, Quinte)
+CHORD_TYPES = ('major', 'minor', 'diminished', 'augmented')
+CHORD_SEMITONES = np.array([[0, 4, 7], [0, 3, 7], [0, 3, 6], [0, 4, 8]], dtype=np.int16)
+CHORD_STEPS = np.array([[0, 2, 4], [0, 2, 4], [0, 2, 4], [0, 2, 4]], dtype=np.int16)
+DEFAULT_VOCABULARY = ('major', 'minor')
+
+# Halbtonabstände der Dur- und (natürlichen) Moll-Tonleiter zur Tonika
+MAJOR_SCALE = np.array([0, 2, 4, 5, 7, 9, 11], dtype=np.int16)
+MINOR_SCALE = np.array([0, 2, 3, 5, 7, 8, 10], dtype=np.int16)
+MODES = ('major', 'minor')
+MODE_SCALES = {'major': MAJOR_SCALE, 'minor': MINOR_SCALE}
+
+# Die 24 Tonarten mit ihrer üblichen Schreibweise der Tonika (music21: '-' für b)
+KEYS = tuple([(tonic, 'major') for tonic in ('C', 'D-', 'D', 'E-', 'E', 'F', 'F#', 'G', 'A-', 'A', 'B-', 'B')]
+             + [(tonic, 'minor') for tonic in ('C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B')])
+
+# Klingender Tonumfang der Trompete in B: E3 bis B-5 (notiert F#3 bis C6)
+TRUMPET_RANGE = (52, 82)
+
+# Mögliche Notenlängen in Viertelnoten, gespeichert als ganze DIVISIONS pro Viertel
+NOTE_LENGTHS = (1, 1.5, 2, 3)
+DIVISIONS = 2
+
+# Partituren pro unabhängigem Zufallsstrom in generate_chord_batch
+BATCH_BLOCK = 1024
+
+# Größe von new_seed(); 53 Bit passen exakt in eine JSON-/JavaScript-Zahl
+SEED_BITS = 53
+
+# Grundtöne: Tonleiter von Tonika3 bis Tonika6, bei C-Dur also C3 bis C6
+ROOT_OCTAVES = (3, 6)
+
+
+def _parse_tonic(tonic):
+    # 'C', 'F#', 'B-' (music21) oder 'Bb' -> (Stammtonindex, Vorzeichen)
+    letter = tonic[:1].upper()
+    if letter not in STEP_NAMES:
+        raise ValueError(f'Unknown key: {tonic!r}')
+    accidental = tonic[1:].replace('b', '-')
+    alter = {value: key for key, value in ACCIDENTALS.items()}.get(accidental)
+    if alter is None:
+        raise ValueError(f'Unknown key: {tonic!r}')
+    return STEP_NAMES.index(letter), alter
+
+
+@lru_cache(maxsize=None)
+def root_table(key='C'):
+    """
+    (MIDI-Nummern, absolute Stammtöne) der möglichen Grundtöne in der Dur-Tonart `key`.
+
+    Stammtöne zählen Oktave * 7 + Stufe und legen die Schreibweise fest; die
+    Tabelle wird pro Tonart einmal berechnet.
+    """
+    letter, alter = _parse_tonic(key)
+    low, high = ROOT_OCTAVES
+    degrees = np.arange((high - low) * 7 + 1)
+    steps = (low * 7 + letter + degrees).astype(np.int16)
+    pitches = ((low + 1) * 12 + STEP_SEMITONES[letter] + alter
+               + 12 * (degrees // 7) + MAJOR_SCALE[degrees % 7]).astype(np.int16)
+    # Geteilt über alle Aufrufe (lru_cache), daher schreibgeschützt
+    pitches.setflags(write=False)
+    steps.setflags(write=False)
+    return pitches, steps
+
+
+ROOT_PITCHES, ROOT_STEPS = root_table('C')
+
+
+@dataclass(frozen=True)
+class DiatonicTable:
+    """
+    Alle leitereigenen Dreiklänge einer Tonart in engen Lagen innerhalb eines Tonumfangs.
+
+    Eine Zeile pro Voicing (Grundstellung, Sext- und Quartsextakkord in jeder
+    Oktave, die ganz in den Umfang passt), Stimmen von unten nach oben:
+    `pitches` und `steps` wie in ChordSequence, `degrees` die Stufe (0 = Tonika),
+    `types` der Index in CHORD_TYPES. Alle Arrays sind schreibgeschützt.
+    """
+    key: str
+    mode: str
+    pitches: np.ndarray
+    steps: np.ndarray
+    degrees: np.ndarray
+    types: np.ndarray
+
+    def __len__(self):
+        return len(self.degrees)
+
+
+def _triad_types(scale):
+    # Akkordtyp (Index in CHORD_TYPES) des Dreiklangs auf jeder der 7 Stufen
+    degrees = np.arange(7)
+    intervals = (scale[(degrees[:, None] + [2, 4]) % 7] - scale[degrees, None]) % 12
+    matches = (intervals[:, None, :] == CHORD_SEMITONES[None, :, 1:]).all(axis=2)
+    return matches.argmax(axis=1)
+
+
+@lru_cache(maxsize=None)
+def _build_diatonic_table(key, mode, pitch_range=TRUMPET_RANGE):
+    if mode not in MODE_SCALES:
+        raise ValueError(f'Unknown mode: {mode!r}, expected one of {MODES}')
+    letter, alter = _parse_tonic(key)
+    scale = MODE_SCALES[mode]
+    tonic_pitch = 12 + STEP_SEMITONES[letter] + alter  # Tonika in Oktave 0
+    low, high = pitch_range
+
+    # Dreiklänge auf allen Stufen über den ganzen MIDI-Bereich, je in drei Umkehrungen:
+    # die untersten Töne eine Oktave (7 Stufen) höher, dann nach oben rotiert
+    chords = np.arange(7 * 10)[:, None] + np.array([0, 2, 4])
+    voiced = np.concatenate([np.roll(chords + 7 * (np.arange(3) < inversion), -inversion, axis=1)
+                             for inversion in range(3)])
+    pitches = tonic_pitch + 12 * (voiced // 7) + scale[voiced % 7]
+    # Voicings außerhalb des Umfangs fallen weg; Reihenfolge nach Lage
+    inside = (pitches.min(axis=1) >= low) & (pitches.max(axis=1) <= high)
+    order = np.lexsort((pitches[:, 2], pitches[:, 1], pitches[:, 0]))
+    order = order[inside[order]]
+
+    pitches = pitches[order].astype(np.uint8)
+    steps = (voiced[order] + letter).astype(np.int16)
+    degrees = (np.tile(chords[:, 0], 3)[order] % 7).astype(np.int8)
+    types = _triad_types(scale)[degrees].astype(np.int8)
+    for array in (pitches, steps, degrees, types):
+        array.setflags(write=False)
+    return DiatonicTable(key=key, mode=mode, pitches=pitches, steps=steps, degrees=degrees, types=types)
+
+
+# Tabellen aller 24 Tonarten, einmal beim Import gebaut
+KEY_TABLES = {(key, mode): _build_diatonic_table(key, mode) for key, mode in KEYS}
+
+
+def diatonic_table(key='C', mode='major'):
+    """
+    DiatonicTable der Tonart im Trompetenumfang; 'Bb' und 'B-' sind gleichwertig.
+
+    Die 24 Tonarten aus KEYS kommen aus KEY_TABLES, andere Schreibweisen
+    (z. B. 'A#' Dur) werden beim ersten Aufruf gebaut und gemerkt.
+    """
+    letter, alter = _parse_tonic(key)
+    key = STEP_NAMES[letter] + ACCIDENTALS[alter]
+    table = KEY_TABLES.get((key, mode))
+    return table if table is not None else _build_diatonic_table(key, mode)
+
+
+# Akkordzustände unabhängig von der Tonart: Abstand des Grundtons zur Tonika (0..11) mal Akkordtyp
+N_CHORD_STATES = 12 * len(CHORD_TYPES)
+
+# Stammtonabstand zur Tonika für jeden Halbtonabstand: b2, 2, b3, 3, 4, #4, 5, b6, 6, b7, 7
+INTERVAL_STEPS = np.array([0, 1, 1, 2, 2, 3, 3, 4, 5, 5, 6, 6], dtype=np.int16)
+
+
+def chord_state(interval, chord_type):
+    """Zustandsnummer für Grundton `interval` Halbtöne über der Tonika und Typindex `chord_type`."""
+    return interval * len(CHORD_TYPES) + chord_type
+
+
+def _state_by_mask():
+    # Zustand relativ zu C für jede Tonklassen-Maske eines vollständigen Dreiklangs, sonst -1.
+    # Übermäßige Dreiklänge sind symmetrisch; es gewinnt der tiefste Grundton.
+    table = np.full(1 << 12, -1, dtype=np.int16)
+    for type_index, semitones in reversed(list(enumerate(CHORD_SEMITONES.tolist()))):
+        for root in reversed(range(12)):
+            table[sum(1 << ((root + interval) % 12) for interval in semitones)] = chord_state(root, type_index)
+    return table
+
+
+STATE_BY_MASK = _state_by_mask()
+
+
+def _respell(pitches, steps):
+    # Mehr als zwei Vorzeichen (z. B. F### im übermäßigen Akkord auf #4) auf den Nachbarstammton umschreiben
+    natural = (steps // 7 + 1) * 12 + STEP_SEMITONES[steps % 7]
+    alter = pitches - natural
+    return steps + (alter > 2) - (alter < -2)
+
+
+@dataclass(frozen=True)
+class VoicingTable:
+    """
+    Enge Lagen aller N_CHORD_STATES Akkordzustände einer Tonart innerhalb eines Tonumfangs.
+
+    Zeilen wie bei DiatonicTable (pitches, steps), sortiert nach Zustand und
+    Lage; die Voicings von Zustand s stehen in den Zeilen
+    offsets[s] bis offsets[s + 1] - 1. Alle Arrays sind schreibgeschützt.
+    """
+    key: str
+    pitches: np.ndarray
+    steps: np.ndarray
+    states: np.ndarray
+    offsets: np.ndarray
+
+
+@lru_cache(maxsize=None)
+def voicing_table(key='C', pitch_range=TRUMPET_RANGE):
+    """VoicingTable für die Tonika `key`, einmal pro Tonart berechnet."""
+    letter, alter = _parse_tonic(key)
+    low, high = pitch_range
+    states = np.arange(N_CHORD_STATES)
+    intervals, types = states // len(CHORD_TYPES), states % len(CHORD_TYPES)
+
+    # Grundstellungen aller Zustände in allen Oktaven, Stammtöne und Tonhöhen ab Oktave 0 wie bei
+    # _build_diatonic_table; dann die Umkehrungen wie dort
+    octaves = 7 * np.arange(10)[None, :, None]
+    root_steps = (letter + INTERVAL_STEPS[intervals])[:, None, None] + octaves
+    root_pitches = (12 + STEP_SEMITONES[letter] + alter + intervals)[:, None, None] + 12 * octaves // 7
+    chord_steps = (root_steps + CHORD_STEPS[types][:, None, :]).reshape(-1, 3)
+    chord_pitches = (root_pitches + CHORD_SEMITONES[types][:, None, :]).reshape(-1, 3)
+    lowered = np.arange(3)
+    steps = np.concatenate([np.roll(chord_steps + 7 * (lowered < inversion), -inversion, axis=1)
+                            for inversion in range(3)])
+    pitches = np.concatenate([np.roll(chord_pitches + 12 * (lowered < inversion), -inversion, axis=1)
+                              for inversion in range(3)])
+    row_states = np.tile(np.repeat(states, 10), 3)
+
+    inside = (pitches.min(axis=1) >= low) & (pitches.max(axis=1) <= high)
+    order = np.lexsort((pitches[:, 2], pitches[:, 1], pitches[:, 0], row_states))
+    order = order[inside[order]]
+
+    pitches = pitches[order]
+    table = VoicingTable(
+        key=key,
+        pitches=pitches.astype(np.uint8),
+        steps=_respell(pitches, steps[order]).astype(np.int16),
+        states=row_states[order].astype(np.int16),
+        offsets=np.searchsorted(row_states[order], np.arange(N_CHORD_STATES + 1)),
+    )
+    for array in (table.pitches, table.steps, table.states, table.offsets):
+        array.setflags(write=False)
+    return table
+
+
+def _length_table():
+    lengths = np.array(NOTE_LENGTHS) * DIVISIONS
+    if not np.all(lengths == np.round(lengths)):
+        raise ValueError('NOTE_LENGTHS must be multiples of 1 / DIVISIONS')
+    return lengths.astype(np.uint16)
+
+
+LENGTH_DIVISIONS = _length_table()
+
+
+@dataclass(frozen=True)
+class ChordSequence:
+    """
+    Akkordfolge als kompakte Integer-Arrays, eine Zeile pro Akkord und eine Spalte pro Stimme.
+
+    `pitches` sind MIDI-Nummern, `steps` die zugehörigen absoluten Stammtöne
+    (für die Schreibweise, z. B. G# statt A-), `durations` die Länge in
+    DIVISIONS pro Viertelnote. music21-Objekte entstehen erst in to_score().
+    """
+    pitches: np.ndarray
+    steps: np.ndarray
+    durations: np.ndarray
+
+    def __len__(self):
+        return len(self.durations)
+
+    @property
+    def n_voices(self):
+        return self.pitches.shape[1]
+
+    def quarter_lengths(self):
+        return self.durations / DIVISIONS
+
+    def onsets(self):
+        """Einsatzzeit jedes Akkords in DIVISIONS ab Stückbeginn."""
+        return np.concatenate([[0], np.cumsum(self.durations[:-1], dtype=np.int64)])
+
+    def pitch_names(self):
+        """Notennamen mit Oktave in music21-Schreibweise, z. B. 'G#4'."""
+        natural = (self.steps // 7 + 1) * 12 + STEP_SEMITONES[self.steps % 7]
+        alter = self.pitches.astype(np.int16) - natural
+        return [
+            [f'{STEP_NAMES[step % 7]}{ACCIDENTALS[int(a)]}{step // 7}' for step, a in zip(row_steps, row_alter)]
+            for row_steps, row_alter in zip(self.steps.tolist(), alter.tolist())
+        ]
+
+    def to_score(self, instrument='Trumpet'):
+        """Baut die music21-Partitur: eine Stimme pro Spalte mit dem angegebenen Instrument."""
+        import music21 as m21
+
+        names = self.pitch_names()
+        lengths = self.quarter_lengths().tolist()
+        score = m21.stream.Score()
+        for voice in range(self.n_voices):
+            part = m21.stream.Part()
+            part.append(getattr(m21.instrument, instrument)())
+            for row, length in zip(names, lengths):
+                part.append(m21.note.Note(row[voice], quarterLength=length))
+            score.append(part)
+        return score
+
+
+def _vocabulary_indices(vocabulary):
+    unknown = [name for name in vocabulary if name not in CHORD_TYPES]
+    if unknown or not vocabulary:
+        raise ValueError(f'Chord vocabulary must be a non-empty subset of {CHORD_TYPES}, got {list(vocabulary)}')
+    return np.array([CHORD_TYPES.index(name) for name in vocabulary], dtype=np.intp)
+
+
+def chord_arrays(roots, types, lengths, key='C'):
+    """
+    Setzt gezogene Indizes (Grundton, Akkordtyp, Länge) beliebiger Form zu Akkorden zusammen.
+
+    Gibt (pitches, steps, durations) zurück; pitches und steps haben eine
+    zusätzliche letzte Achse für die Stimmen. Reine Tabellenzugriffe.
+    """
+    root_pitches, root_steps = root_table(key)
+    pitches = (root_pitches[roots][..., None] + CHORD_SEMITONES[types]).astype(np.uint8)
+    steps = root_steps[roots][..., None] + CHORD_STEPS[types]
+    return pitches, steps, LENGTH_DIVISIONS[lengths]
+
+
+@dataclass(frozen=True)
+class ChordBatch:
+    """
+    Viele gleich lange Akkordfolgen als Arrays mit führender Achse pro Partitur.
+
+    pitches/steps: (Partituren, Akkorde, Stimmen), durations: (Partituren, Akkorde).
+    """
+    pitches: np.ndarray
+    steps: np.ndarray
+    durations: np.ndarray
+
+    def __len__(self):
+        return len(self.durations)
+
+    def __getitem__(self, index):
+        return ChordSequence(pitches=self.pitches[index], steps=self.steps[index], durations=self.durations[index])
+
+
+def new_seed():
+    """Frischer Seed aus der Entropie des Systems; SEED_BITS groß, damit er als JSON-Zahl exakt bleibt."""
+    return int(np.random.SeedSequence().generate_state(1, np.uint64)[0] >> (64 - SEED_BITS))
+
+
+def _block_rng(seed, block):
+    # Unabhängiger Zufallsstrom pro Block von BATCH_BLOCK Partituren
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block,)))
+
+
+def _blocks(seed, count, start, draw, empty):
+    # draw(rng, n) für jeden Block, der die Partituren start .. start + count - 1 berührt,
+    # zusammengesetzt und auf genau diese Partituren zugeschnitten
+    draws = []
+    stop = start + count
+    for block in range(start // BATCH_BLOCK, -(-stop // BATCH_BLOCK)):
+        block_start = block * BATCH_BLOCK
+        needed = min(stop, block_start + BATCH_BLOCK) - block_start
+        draws.append(draw(_block_rng(seed, block), needed)[max(start - block_start, 0):])
+    return np.concatenate(draws) if draws else empty
+
+
+def _draw(seed, bounds, count, length, start):
+    # (count, len(bounds), length) Ganzzahlen für die Partituren start .. start + count - 1.
+    # Pro Akkord werden alle Größen direkt hintereinander gezogen, so sind die
+    # ersten Partituren eines Blocks unabhängig von der Blockgröße.
+    bounds = np.asarray(bounds)[:, None]
+    return _blocks(seed, count, start, lambda rng, n: rng.integers(0, bounds, size=(n, len(bounds), length)),
+                   np.zeros((0, len(bounds), length), dtype=np.int64))
+
+
+def uniform_draws(seed, count, n_values, length, start=0):
+    """
+    (count, n_values, length) gleichverteilte Zahlen in [0, 1) für die Partituren start .. start + count - 1.
+
+    Dieselben Blöcke und Zufallsströme wie generate_chord_batch, für Generatoren,
+    die ihre Auswahl selbst aus Wahrscheinlichkeiten treffen.
+    """
+    return _blocks(seed, count, start, lambda rng, n: rng.random(size=(n, n_values, length)),
+                   np.zeros((0, n_values, length)))
+
+
+def generate_chord_batch(count, length=64, key='C', vocabulary=None, seed=None, start=0, mode=None):
+    """
+    Die Akkordfolgen `start` bis `start + count - 1` zum `seed` als ChordBatch.
+
+    Ohne `mode` werden Grundtöne der Dur-Tonleiter mit beliebigen Akkordtypen
+    aus `vocabulary` (Standard: DEFAULT_VOCABULARY) kombiniert. Mit mode='major'
+    oder 'minor' kommen die Akkorde aus der DiatonicTable der Tonart: nur
+    leitereigene Dreiklänge in Trompetenlage, auf Typen aus `vocabulary`
+    beschränkt (Standard: alle). Beides sind reine Tabellenzugriffe.
+
+    Jede Partitur hängt nur von (seed, Parametern, ihrem Index) ab: Partituren
+    werden in Blöcken von BATCH_BLOCK aus je einem eigenen numpy-Generator
+    gezogen, vektorisiert für den ganzen Block. Eine große Batch lässt sich daher
+    über `start` beliebig auf Prozesse aufteilen und ergibt dieselben Partituren.
+    Ohne seed wird new_seed() verwendet.
+    """
+    if seed is None:
+        seed = new_seed()
+
+    if mode is None:
+        types_available = _vocabulary_indices(DEFAULT_VOCABULARY if vocabulary is None else vocabulary)
+        bounds = [len(root_table(key)[0]), len(types_available), len(LENGTH_DIVISIONS)]
+        draws = _draw(seed, bounds, count, length, start)
+        roots, types, lengths = draws[:, 0], types_available[draws[:, 1]], draws[:, 2]
+        pitches, steps, durations = chord_arrays(roots, types, lengths, key)
+        return ChordBatch(pitches=pitches, steps=steps, durations=durations)
+
+    table = diatonic_table(key, mode)
+    voicings = np.arange(len(table))
+    if vocabulary is not None:
+        voicings = voicings[np.isin(table.types, _vocabulary_indices(vocabulary))]
+        if len(voicings) == 0:
+            raise ValueError(f'No chord of {list(vocabulary)} is diatonic in {key} {mode}')
+    draws = _draw(seed, [len(voicings), len(LENGTH_DIVISIONS)], count, length, start)
+    rows = voicings[draws[:, 0]]
+    return ChordBatch(pitches=table.pitches[rows], steps=table.steps[rows], durations=LENGTH_DIVISIONS[draws[:, 1]])
+
+
+def generate_chords(n_chords=64, seed=None, key='C', vocabulary=None, mode=None):
+    """
+    Zufällige Akkorde in der Tonart `key` als ChordSequence.
+
+    Ohne `mode` Akkordtypen aus `vocabulary` über den Stufen der Dur-Tonleiter,
+    mit mode='major'/'minor' leitereigene Dreiklänge in Trompetenlage (siehe
+    generate_chord_batch). Alles kommt aus einem eigenen, mit `seed`
+    initialisierten numpy-Generator; gleicher seed mit gleichen Parametern
+    ergibt dieselbe Folge (die erste Partitur von generate_chord_batch). Die
+    Stimmen ergeben sich aus den Tabellen ohne einzelne Pitch-Objekte.
+    """
+    return generate_chord_batch(1, length=n_chords, key=key, vocabulary=vocabulary, seed=seed, mode=mode)[0]
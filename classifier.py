@@ -0,0 +1,203 @@
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from audio_features import load_feature_config
+
+# Activations the NumPy forward pass understands
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'tanh': np.tanh,
+    # tanh form of the logistic function; no overflow for large |x|
+    'sigmoid': lambda x: 0.5 * (1.0 + np.tanh(0.5 * x)),
+}
+
+
+def export_path_for(model_path):
+    """Where the NumPy export of a Keras model file is written."""
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def export_numpy_model(keras_model, path):
+    """
+    Save the Dense layers of a Sequential Dense/Dropout network as plain arrays.
+
+    Dropout is the identity at inference time and is dropped. A model with
+    several inputs is supported when they are concatenated before the first
+    Dense layer (create_model with a MIDI input); the number of inputs is
+    stored. The file is written to a temporary name and renamed so readers
+    never see it half done.
+    """
+    arrays = {}
+    n_dense = 0
+    for layer in keras_model.layers:
+        kind = type(layer).__name__
+        if kind in ('Dropout', 'InputLayer'):
+            continue
+        if kind == 'Concatenate' and n_dense == 0:
+            continue
+        if kind != 'Dense':
+            raise ValueError(f'Cannot export layer {layer.name} of type {kind}')
+        activation = layer.get_config()['activation']
+        if activation not in ACTIVATIONS:
+            raise ValueError(f'Cannot export activation {activation!r} of layer {layer.name}')
+        kernel, bias = layer.get_weights()
+        arrays[f'kernel_{n_dense}'] = kernel.astype(np.float32)
+        arrays[f'bias_{n_dense}'] = bias.astype(np.float32)
+        arrays[f'activation_{n_dense}'] = np.asarray(activation)
+        n_dense += 1
+
+    buffer = io.BytesIO()
+    n_inputs = len(keras_model.inputs) if isinstance(keras_model.inputs, (list, tuple)) else 1
+    np.savez(buffer, n_layers=np.asarray(n_dense), n_inputs=np.asarray(n_inputs), **arrays)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+class NumpyModel:
+    """
+    Forward pass of an exported Dense network: one matmul and activation per layer, no TensorFlow.
+
+    Models with several inputs take a list of arrays, like Keras, and
+    concatenate them in order.
+    """
+
+    def __init__(self, layers, n_inputs=1):
+        self.layers = layers
+        self.n_inputs = n_inputs
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            layers = [
+                (data[f'kernel_{i}'], data[f'bias_{i}'], ACTIVATIONS[str(data[f'activation_{i}'])])
+                for i in range(int(data['n_layers']))
+            ]
+            # Exports written before multi-input support have a single input
+            n_inputs = int(data['n_inputs']) if 'n_inputs' in data.files else 1
+        return cls(layers, n_inputs)
+
+    def predict_on_batch(self, X):
+        if self.n_inputs > 1:
+            if len(X) != self.n_inputs:
+                raise ValueError(f'Model expects {self.n_inputs} inputs, got {len(X)}')
+            X = np.concatenate([np.asarray(part, dtype=np.float32) for part in X], axis=1)
+        out = np.asarray(X, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            out = activation(out @ kernel + bias)
+        return out
+
+
+def _load_keras_model(model_path):
+    import tensorflow as tf
+
+    # Inference is CPU only; hide GPUs before TensorFlow initialises them
+    try:
+        tf.config.set_visible_devices([], 'GPU')
+    except RuntimeError:
+        pass  # Devices were already initialised by another import
+    return tf.keras.models.load_model(model_path, compile=False)
+
+
+def load_classifier(model_path, model_loader=NumpyModel.load):
+    """(model, FeatureConfig) of a trained classifier; the loader for its ModelHandle."""
+    return model_loader(model_path), load_feature_config(model_path)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent predict() calls into one forward pass.
+
+    The first request opens a window of `max_wait` seconds (or until
+    `max_batch` requests are queued); everything collected by then is stacked
+    and scored with a single predict_on_batch call on a background thread.
+    Vectors are checked against `feature_size` in submit(), so one malformed
+    request cannot fail the batch it would have been stacked into.
+    `model_handle` is a model_handle.ModelHandle with load_classifier as its
+    loader.
+    """
+
+    def __init__(self, model_handle, feature_size, max_batch=64, max_wait=0.005):
+        self.model_handle = model_handle
+        self.feature_size = feature_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_started(self):
+        # Started lazily so forked server workers each get their own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='classifier-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, features):
+        """
+        Queue one feature vector; returns a Future resolving to the model's output row.
+
+        Raises ValueError right away if the vector is not of shape (feature_size,).
+        """
+        vector = np.asarray(features, dtype=np.float32)
+        if vector.shape != (self.feature_size,):
+            raise ValueError(f'Expected a feature vector of shape ({self.feature_size},), got {vector.shape}')
+        self._ensure_started()
+        future = Future()
+        self._queue.put((vector, future))
+        return future
+
+    def predict(self, features, timeout=30.0):
+        return self.submit(features).result(timeout=timeout)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+            live = [(vector, future) for vector, future in batch if future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            futures = [future for _, future in live]
+            try:
+                model, _ = self.model_handle.get()
+                outputs = np.asarray(model.predict_on_batch(np.stack([vector for vector, _ in live])))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(futures)
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'model_reloads': self.model_handle.reloads,
+        }
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from locking import file_lock
+
+# Every n-th row is held out for validation; fixed by position so the split
+# stays the same as the store grows
+VALIDATION_EVERY = 5
+
+# Rows read from the memory-mapped files per tf.data element before unbatching
+SHARD_ROWS = 4096
+
+
+class DatasetStore:
+    """
+    Append-only store of labelled feature vectors accumulated across uploads.
+
+    Rows are raw float32 vectors in `features.f32` and uint8 labels in
+    `labels.u8`; `meta.json` pins the vector size and the FeatureConfig tag so
+    vectors made with different settings are never mixed. `batches.json` is
+    the commit record: the committed row count and a digest of every appended
+    batch. Appends hold an advisory file lock, trim both files to the committed
+    rows (so a crash mid-append cannot misalign features and labels) and skip a
+    batch whose digest is already recorded, so retrying the same upload after
+    a failed or cancelled training run does not add its rows twice. Readers
+    map the files read-only and never need to load the whole matrix. The
+    metadata is checked on first append or read, not when the store is opened,
+    so a mismatch fails that operation instead of the process importing the
+    store.
+    """
+
+    def __init__(self, directory, feature_size, config_tag):
+        self.directory = directory
+        self.feature_size = feature_size
+        self.config_tag = config_tag
+        self._features_path = os.path.join(directory, 'features.f32')
+        self._labels_path = os.path.join(directory, 'labels.u8')
+        self._batches_path = os.path.join(directory, 'batches.json')
+        self._lock = threading.Lock()
+        self._meta_checked = False
+
+    def _check_meta(self):
+        # Raises ValueError if the rows on disk were made with other settings
+        if self._meta_checked:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = os.path.join(self.directory, 'meta.json')
+        meta = {'feature_size': self.feature_size, 'config_tag': self.config_tag}
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(f'Dataset in {self.directory} was built with {stored}, not {meta}')
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        self._meta_checked = True
+
+    def _row_bytes(self):
+        return self.feature_size * 4
+
+    def _written_rows(self):
+        n_features = os.path.getsize(self._features_path) // self._row_bytes() if os.path.exists(self._features_path) else 0
+        n_labels = os.path.getsize(self._labels_path) if os.path.exists(self._labels_path) else 0
+        return min(n_features, n_labels)
+
+    def _batches(self):
+        # Stores from before the commit record count every written row as committed
+        if not os.path.exists(self._batches_path):
+            return {'rows': self._written_rows(), 'digests': []}
+        with open(self._batches_path, 'r') as f:
+            return json.load(f)
+
+    def _complete_rows(self):
+        return min(self._written_rows(), self._batches()['rows'])
+
+    def __len__(self):
+        return self._complete_rows()
+
+    def append(self, features, labels):
+        """Append rows unless this exact batch was appended before; returns the total number of rows."""
+        features = np.ascontiguousarray(features, dtype=np.float32).reshape(-1, self.feature_size)
+        labels = np.ascontiguousarray(labels, dtype=np.uint8).reshape(-1)
+        if len(features) != len(labels):
+            raise ValueError('features and labels must have the same length')
+
+        with self._lock:
+            self._check_meta()
+        digest = hashlib.sha256(features.tobytes() + labels.tobytes()).hexdigest()
+        with self._lock, file_lock(self._features_path):
+            batches = self._batches()
+            n = min(self._written_rows(), batches['rows'])
+            if digest in batches['digests']:
+                return n
+            for path, size in ((self._features_path, n * self._row_bytes()), (self._labels_path, n)):
+                with open(path, 'ab') as f:
+                    f.truncate(size)
+            with open(self._features_path, 'ab') as f:
+                f.write(features.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._labels_path, 'ab') as f:
+                f.write(labels.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            # The rows count only once the record naming them is in place
+            batches = {'rows': n + len(labels), 'digests': batches['digests'] + [digest]}
+            tmp_path = self._batches_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(batches, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._batches_path)
+            return batches['rows']
+
+    def arrays(self):
+        """Read-only memory-mapped (features, labels) of all complete rows."""
+        with self._lock:
+            self._check_meta()
+        n = self._complete_rows()
+        if n == 0:
+            return np.zeros((0, self.feature_size), dtype=np.float32), np.zeros(0, dtype=np.uint8)
+        features = np.memmap(self._features_path, dtype=np.float32, mode='r', shape=(n, self.feature_size))
+        labels = np.memmap(self._labels_path, dtype=np.uint8, mode='r', shape=(n,))
+        return features, labels
+
+    def split_sizes(self, n=None):
+        """(train, validation) row counts; validation is every VALIDATION_EVERY-th row."""
+        n = len(self) if n is None else n
+        validation = n // VALIDATION_EVERY
+        return n - validation, validation
+
+    def tf_dataset(self, validation=False, batch_size=32, shuffle_buffer=8192, seed=None):
+        """
+        tf.data pipeline of (features, label) batches over the training or validation rows.
+
+        The rows are cut into shards of SHARD_ROWS, which are read from the
+        memory-mapped files by parallel map calls, so the matrix never has to fit
+        in memory. Training data is shuffled at shard level and again through a
+        `shuffle_buffer`-row buffer; batches are prefetched while the model trains.
+        """
+        import tensorflow as tf
+
+        features, labels = self.arrays()
+        n = len(labels)
+
+        def load_shard(start):
+            start = int(start)
+            stop = min(start + SHARD_ROWS, n)
+            is_validation = np.arange(start, stop) % VALIDATION_EVERY == VALIDATION_EVERY - 1
+            keep = is_validation if validation else ~is_validation
+            return np.asarray(features[start:stop][keep]), np.asarray(labels[start:stop][keep], dtype=np.float32)
+
+        def read(start):
+            x, y = tf.numpy_function(load_shard, [start], (tf.float32, tf.float32))
+            x.set_shape((None, self.feature_size))
+            y.set_shape((None,))
+            return x, y
+
+        shuffle = not validation
+        dataset = tf.data.Dataset.from_tensor_slices(np.arange(0, n, SHARD_ROWS, dtype=np.int64))
+        if shuffle:
+            dataset = dataset.shuffle(max(1, -(-n // SHARD_ROWS)), seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.map(read, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        dataset = dataset.unbatch()
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of the file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Persistent, size-capped cache of feature vectors keyed by audio content.
+
+    Vectors live in one preallocated float32 memory-mapped array (`features.f32`),
+    one row per slot; an SQLite index maps keys to slots and tracks last use.
+    When every slot is taken the least recently used entry gives up its slot.
+    Lookups and slot allocation both run inside an IMMEDIATE transaction, so
+    several worker processes can share the same cache directory without a
+    reader seeing a slot that is being handed to another key.
+
+    Nothing is created when the cache is constructed: the directory, the data
+    file and the SQLite connection are opened on first use and once per
+    process, so workers forked after import (gunicorn --preload) never share
+    the parent's connection.
+    """
+
+    def __init__(self, directory, vector_size, max_bytes=64 * 1024 * 1024, version=1):
+        self.directory = directory
+        self.vector_size = vector_size
+        self.version = version
+        self.capacity = max(1, max_bytes // (vector_size * 4))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._connection = None
+        self._memmap = None
+        self._pid = None
+
+    def _ensure_open(self):
+        if self._pid != os.getpid():
+            with self._connect_lock:
+                if self._pid != os.getpid():
+                    # An inherited connection belongs to the parent; drop it without closing
+                    self._memmap, self._connection = self._open()
+                    self._pid = os.getpid()
+
+    @property
+    def _conn(self):
+        self._ensure_open()
+        return self._connection
+
+    @property
+    def _data(self):
+        self._ensure_open()
+        return self._memmap
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        data_path = os.path.join(self.directory, 'features.f32')
+        if not os.path.exists(data_path) or os.path.getsize(data_path) != self.capacity * self.vector_size * 4:
+            self._reset(data_path)
+        data = np.memmap(data_path, dtype=np.float32, mode='r+', shape=(self.capacity, self.vector_size))
+
+        conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=30,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS entries '
+                     '(key TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+        return data, conn
+
+    def _reset(self, data_path):
+        # Capacity or layout changed: start over with an empty, sparse data file
+        index_path = os.path.join(self.directory, 'index.db')
+        for path in (index_path, index_path + '-wal', index_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        with open(data_path, 'wb') as f:
+            f.truncate(self.capacity * self.vector_size * 4)
+
+    def key_for(self, digest, variant=''):
+        # The feature code version and decoding settings are part of the key so
+        # vectors made under other settings are never reused
+        return f'v{self.version}:{variant}:{digest}'
+
+    def get(self, key):
+        # The slot is read under the same write lock put() holds while it evicts and
+        # overwrites slots, so another process cannot reuse it between lookup and copy
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            row = self._conn.execute('SELECT slot FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+            return np.array(self._data[row[0]])
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.vector_size,):
+            raise ValueError(f'Expected vector of size {self.vector_size}, got shape {vector.shape}')
+
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = self._conn.execute('SELECT slot FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                slot = row[0]
+                self._conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (now, key))
+            else:
+                slot = self._allocate_slot()
+                self._conn.execute('INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)', (key, slot, now))
+            self._data[slot] = vector
+            self._data.flush()
+
+    def _allocate_slot(self):
+        # Caller holds the write transaction. Entries are only removed by eviction,
+        # which hands its slot straight to the new entry, so used slots stay 0..used-1
+        (used,) = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()
+        if used < self.capacity:
+            return used
+        key, slot = self._conn.execute('SELECT key, slot FROM entries ORDER BY last_used LIMIT 1').fetchone()
+        self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self.evictions += 1
+        return slot
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': entries,
+                'capacity': self.capacity,
+            }
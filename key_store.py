@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+class SqliteKeyBackend:
+    """
+    Key registry stored as one row per key in a local SQLite database.
+
+    Runs in WAL mode so readers never block the single writer, and each change
+    touches only its own row. `PRAGMA data_version` changes whenever another
+    connection (or process) commits, which is what the cache uses to detect
+    outside edits. An existing JSON registry is imported on first use.
+
+    The connection is opened lazily and once per process, so workers forked
+    after import (gunicorn --preload) never share the parent's connection.
+    Threads of one process share it; ApiKeyStore serialises access.
+    """
+
+    # data_version only moves for commits made by other connections
+    tracks_own_writes = False
+
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        self.legacy_json = legacy_json
+        self._connection = None
+        self._pid = None
+        self._connect_lock = threading.Lock()
+
+    @property
+    def _conn(self):
+        if self._pid != os.getpid():
+            with self._connect_lock:
+                if self._pid != os.getpid():
+                    # An inherited connection belongs to the parent; drop it without closing
+                    self._connection = self._connect()
+                    self._pid = os.getpid()
+        return self._connection
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS api_keys (api_key TEXT PRIMARY KEY, active INTEGER NOT NULL)')
+        if self.legacy_json:
+            self._import_json(conn, self.legacy_json)
+        return conn
+
+    def _import_json(self, conn, json_path):
+        if not os.path.exists(json_path):
+            return
+        with open(json_path, 'r') as f:
+            api_keys = json.load(f)
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            (count,) = conn.execute('SELECT COUNT(*) FROM api_keys').fetchone()
+            if count:
+                return
+            conn.executemany(
+                'INSERT OR IGNORE INTO api_keys (api_key, active) VALUES (?, ?)',
+                [(api_key, int(bool(active))) for api_key, active in api_keys.items()],
+            )
+
+    def signature(self):
+        (version,) = self._conn.execute('PRAGMA data_version').fetchone()
+        return version
+
+    def read_all(self):
+        rows = self._conn.execute('SELECT api_key, active FROM api_keys').fetchall()
+        return {api_key: bool(active) for api_key, active in rows}
+
+    def write_all(self, api_keys):
+        with self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute('DELETE FROM api_keys')
+            self._conn.executemany(
+                'INSERT INTO api_keys (api_key, active) VALUES (?, ?)',
+                [(api_key, int(bool(active))) for api_key, active in api_keys.items()],
+            )
+
+    def put(self, api_key, value=True):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO api_keys (api_key, active) VALUES (?, ?)',
+            (api_key, int(bool(value))),
+        )
+
+    def delete(self, api_key):
+        cursor = self._conn.execute('DELETE FROM api_keys WHERE api_key = ?', (api_key,))
+        return cursor.rowcount > 0
+
+
+class ApiKeyStore:
+    """
+    In-memory view of the API key registry kept by a storage backend.
+
+    The registry is read once and kept as a dict; a cheap signature check on
+    each lookup detects edits made by other processes and only then triggers a
+    reload. Changes made through this store update the cache directly.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._signature = None
+        self._loaded = False
+        # Cache hits (registry unchanged) and misses (registry re-read), one per lookup or change
+        self.hits = 0
+        self.misses = 0
+
+    def _refresh(self):
+        # Caller must hold self._lock
+        signature = self.backend.signature()
+        if self._loaded and signature == self._signature:
+            self.hits += 1
+            return
+        self.misses += 1
+        self._keys = self.backend.read_all()
+        self._signature = signature
+        self._loaded = True
+
+    def _after_write(self):
+        # Our own write must not count as an outside change on the next lookup
+        if self.backend.tracks_own_writes:
+            self._signature = self.backend.signature()
+
+    def is_valid(self, api_key):
+        if api_key is None:
+            return False
+        with self._lock:
+            self._refresh()
+            return api_key in self._keys
+
+    def load(self):
+        with self._lock:
+            self._refresh()
+            return dict(self._keys)
+
+    def save(self, api_keys):
+        with self._lock:
+            self.backend.write_all(api_keys)
+            self._keys = dict(api_keys)
+            self._loaded = True
+            self._after_write()
+
+    def add(self, api_key, value=True):
+        with self._lock:
+            self._refresh()
+            self.backend.put(api_key, value)
+            self._keys[api_key] = value
+            self._after_write()
+
+    def remove(self, api_key):
+        with self._lock:
+            self._refresh()
+            removed = self.backend.delete(api_key)
+            self._keys.pop(api_key, None)
+            self._after_write()
+            return removed
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'keys': len(self._keys),
+            }
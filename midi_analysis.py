@@ -0,0 +1,289 @@
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+from chord_engine import CHORD_SEMITONES, CHORD_TYPES, DIVISIONS
+
+PITCH_CLASS_NAMES = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+
+# Tempo ohne Tempo-Ereignis in der Datei (120 BPM), in Mikrosekunden pro Viertel
+DEFAULT_TEMPO = 500000
+
+# Zeiteinheiten von parse_midi
+TIME_UNITS = ('seconds', 'quarters')
+
+# Anzahl Noten, die im Analysetext einzeln aufgeführt werden
+LISTED_NOTES = 10
+
+# Nachkommastellen, auf die Einsatzzeiten beim Gruppieren zu Akkorden gerundet werden
+ONSET_DECIMALS = 6
+
+
+def _quality_table():
+    # Akkordtyp für jede der 4096 Tonklassen-Masken; -1 = kein bekannter Dreiklang
+    table = np.full(1 << 12, -1, dtype=np.int8)
+    for type_index, semitones in enumerate(CHORD_SEMITONES.tolist()):
+        for root in range(12):
+            table[sum(1 << ((root + interval) % 12) for interval in semitones)] = type_index
+    return table
+
+
+QUALITY_BY_MASK = _quality_table()
+
+# Anzahl verschiedener Tonklassen je Maske
+CLASS_COUNT_BY_MASK = np.array([bin(mask).count('1') for mask in range(1 << 12)], dtype=np.int8)
+
+
+def pitch_name(pitch):
+    return f'{PITCH_CLASS_NAMES[pitch % 12]}{pitch // 12 - 1}'
+
+
+@dataclass(frozen=True)
+class NoteArrays:
+    """
+    Noten als parallele Arrays: Tonhöhe (MIDI), Beginn und Ende (Sekunden oder Viertel), Anschlagstärke, Stimme.
+
+    Stimmen sind fortlaufend nummeriert (Spalte einer ChordSequence bzw.
+    Spur/Kanal einer MIDI-Datei in der Reihenfolge ihres Auftretens).
+    """
+    pitch: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    velocity: np.ndarray
+    voice: np.ndarray
+
+    def __len__(self):
+        return len(self.pitch)
+
+
+def notes_from_sequence(sequence, tempo_bpm=120, velocity=90):
+    """NoteArrays direkt aus einer ChordSequence, ohne MIDI-Umweg."""
+    seconds_per_division = 60.0 / tempo_bpm / DIVISIONS
+    onsets = sequence.onsets() * seconds_per_division
+    ends = onsets + sequence.durations * seconds_per_division
+    n_chords, n_voices = sequence.pitches.shape
+    return NoteArrays(
+        pitch=sequence.pitches.T.reshape(-1).astype(np.int16),
+        start=np.tile(onsets, n_voices),
+        end=np.tile(ends, n_voices),
+        velocity=np.full(n_chords * n_voices, velocity, dtype=np.int16),
+        voice=np.repeat(np.arange(n_voices), n_chords),
+    )
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _parse_track(data, pos, end, track, tempos, rows, voices):
+    tick = 0
+    status = None
+    active = {}
+    while pos < end:
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        if data[pos] & 0x80:
+            status = data[pos]
+            pos += 1
+        elif status is None:
+            raise ValueError('Running status without a preceding status byte')
+
+        if status == 0xFF:
+            kind = data[pos]
+            length, pos = _read_varlen(data, pos + 1)
+            if kind == 0x51 and length == 3:
+                tempos.append((tick, int.from_bytes(data[pos:pos + 3], 'big')))
+            pos += length
+            if kind == 0x2F:
+                break
+            status = None  # Meta- und SysEx-Ereignisse beenden den Running Status
+            continue
+        if status in (0xF0, 0xF7):
+            length, pos = _read_varlen(data, pos)
+            pos += length
+            status = None
+            continue
+
+        kind, channel = status & 0xF0, status & 0x0F
+        if kind in (0xC0, 0xD0):
+            pos += 1
+            continue
+        first, second = data[pos], data[pos + 1]
+        pos += 2
+        if kind == 0x90 and second > 0:
+            active.setdefault((channel, first), []).append((tick, second))
+        elif kind == 0x80 or kind == 0x90:
+            started = active.get((channel, first))
+            if started:
+                start_tick, velocity = started.pop(0)
+                voice = voices.setdefault((track, channel), len(voices))
+                rows.append((first, start_tick, tick, velocity, voice))
+    return pos
+
+
+def _ticks_to_seconds(ticks, tempos, division):
+    # Tempowechsel als stückweise lineare Abbildung Ticks -> Sekunden
+    tempos = sorted(tempos) or [(0, DEFAULT_TEMPO)]
+    if tempos[0][0] != 0:
+        tempos.insert(0, (0, DEFAULT_TEMPO))
+    change_ticks = np.array([tick for tick, _ in tempos], dtype=np.float64)
+    seconds_per_tick = np.array([tempo for _, tempo in tempos], dtype=np.float64) / 1e6 / division
+    change_seconds = np.concatenate([[0.0], np.cumsum(np.diff(change_ticks) * seconds_per_tick[:-1])])
+    segment = np.searchsorted(change_ticks, ticks, side='right') - 1
+    return change_seconds[segment] + (ticks - change_ticks[segment]) * seconds_per_tick[segment]
+
+
+def parse_midi(data, unit='seconds'):
+    """
+    Liest die Noten einer Standard-MIDI-Datei (Format 0 oder 1) aus Bytes in NoteArrays.
+
+    Berücksichtigt Running Status, Note-on mit Anschlag 0 als Note-off und
+    Tempowechsel. Gleichzeitig offene Noten gleicher Tonhöhe werden in der
+    Reihenfolge ihres Beginns geschlossen. Mit unit='quarters' stehen Beginn
+    und Ende in Viertelnoten statt Sekunden, unabhängig vom Tempo.
+    """
+    if unit not in TIME_UNITS:
+        raise ValueError(f'unit must be one of {TIME_UNITS}')
+    data = bytes(data)
+    if data[:4] != b'MThd':
+        raise ValueError('Not a Standard MIDI File')
+    (header_size,) = struct.unpack('>I', data[4:8])
+    _, n_tracks, division = struct.unpack('>HHH', data[8:14])
+    if division & 0x8000:
+        raise ValueError('SMPTE time division is not supported')
+
+    pos = 8 + header_size
+    tempos = []
+    rows = []
+    voices = {}
+    for track in range(n_tracks):
+        if pos + 8 > len(data):
+            raise ValueError('MIDI file is truncated')
+        kind = data[pos:pos + 4]
+        (size,) = struct.unpack('>I', data[pos + 4:pos + 8])
+        pos += 8
+        if kind == b'MTrk':
+            try:
+                _parse_track(data, pos, pos + size, track, tempos, rows, voices)
+            except IndexError:
+                raise ValueError('MIDI track is truncated')
+        pos += size
+
+    table = np.array(rows, dtype=np.int64).reshape(-1, 5)
+    if unit == 'quarters':
+        start, end = table[:, 1] / division, table[:, 2] / division
+    else:
+        start, end = _ticks_to_seconds(table[:, 1], tempos, division), _ticks_to_seconds(table[:, 2], tempos, division)
+    return NoteArrays(
+        pitch=table[:, 0].astype(np.int16),
+        start=start,
+        end=end,
+        velocity=table[:, 3].astype(np.int16),
+        voice=table[:, 4],
+    )
+
+
+def _voice_matrix(notes):
+    # Tonhöhe jeder Stimme zu jedem Einsatzzeitpunkt (Zeilen) oder -1, wenn sie dort nicht klingt
+    onsets = np.unique(np.round(notes.start, ONSET_DECIMALS))
+    n_voices = int(notes.voice.max()) + 1 if len(notes) else 0
+    matrix = np.full((len(onsets), n_voices), -1, dtype=np.int16)
+    for voice in range(n_voices):
+        mine = np.flatnonzero(notes.voice == voice)
+        mine = mine[np.argsort(notes.start[mine], kind='stable')]
+        starts = np.round(notes.start[mine], ONSET_DECIMALS)
+        index = np.searchsorted(starts, onsets, side='right') - 1
+        sounding = (index >= 0) & (np.round(notes.end[mine][np.maximum(index, 0)], ONSET_DECIMALS) > onsets)
+        matrix[sounding, voice] = notes.pitch[mine][index[sounding]]
+    return matrix
+
+
+def _voice_crossings(matrix):
+    # Wechsel der Reihenfolge zweier Stimmen zwischen aufeinanderfolgenden Akkorden, in denen beide klingen
+    crossings = 0
+    for upper in range(matrix.shape[1]):
+        for lower in range(upper + 1, matrix.shape[1]):
+            both = (matrix[:, upper] >= 0) & (matrix[:, lower] >= 0)
+            order = np.sign(matrix[both, upper] - matrix[both, lower])
+            order = order[order != 0]
+            crossings += int(np.count_nonzero(order[1:] != order[:-1]))
+    return crossings
+
+
+def _chord_qualities(matrix):
+    bits = np.where(matrix >= 0, np.left_shift(1, np.maximum(matrix, 0) % 12), 0)
+    masks = np.bitwise_or.reduce(bits, axis=1) if matrix.shape[1] else np.zeros(len(matrix), dtype=np.int64)
+    n_classes = CLASS_COUNT_BY_MASK[masks]
+    qualities = QUALITY_BY_MASK[masks]
+    counts = {name: int(np.count_nonzero(qualities == i)) for i, name in enumerate(CHORD_TYPES)}
+    counts['other'] = int(np.count_nonzero((qualities < 0) & (n_classes >= 3)))
+    counts['incomplete'] = int(np.count_nonzero(n_classes < 3))
+    return counts
+
+
+def analyze_notes(notes):
+    """
+    Statistiken zu NoteArrays als dict (JSON-fähig).
+
+    Tonhöhen-Histogramm, Tonklassen-Histogramm, Umfang, Notendichte,
+    Akkordqualitäten pro Einsatzzeitpunkt, Stimmkreuzungen und die ersten
+    LISTED_NOTES Noten (nach Stimme, dann Zeit, wie Magenta sie auflistet).
+    """
+    total = len(notes)
+    if total == 0:
+        return {'total_notes': 0, 'voices': 0, 'duration_seconds': 0.0, 'notes_per_second': 0.0,
+                'lowest_pitch': None, 'highest_pitch': None, 'pitch_histogram': {},
+                'pitch_class_histogram': dict.fromkeys(PITCH_CLASS_NAMES, 0), 'chord_qualities': {},
+                'voice_crossings': 0, 'first_notes': []}
+
+    duration = float(notes.end.max() - notes.start.min())
+    pitch_counts = np.bincount(notes.pitch, minlength=128)
+    class_counts = np.bincount(notes.pitch % 12, minlength=12)
+    matrix = _voice_matrix(notes)
+    listed = np.lexsort((notes.start, notes.voice))[:LISTED_NOTES]
+
+    return {
+        'total_notes': total,
+        'voices': matrix.shape[1],
+        'duration_seconds': duration,
+        'notes_per_second': total / duration if duration > 0 else 0.0,
+        'lowest_pitch': int(notes.pitch.min()),
+        'highest_pitch': int(notes.pitch.max()),
+        'pitch_histogram': {pitch_name(int(p)): int(pitch_counts[p]) for p in np.flatnonzero(pitch_counts)},
+        'pitch_class_histogram': dict(zip(PITCH_CLASS_NAMES, class_counts.tolist())),
+        'chord_qualities': _chord_qualities(matrix),
+        'voice_crossings': _voice_crossings(matrix),
+        'first_notes': [
+            {'pitch': int(notes.pitch[i]), 'start': float(notes.start[i]), 'duration': float(notes.end[i] - notes.start[i])}
+            for i in listed
+        ],
+    }
+
+
+def analyze_midi(data):
+    """analyze_notes für MIDI-Bytes."""
+    return analyze_notes(parse_midi(data))
+
+
+def format_analysis(stats):
+    """Analysetext wie bisher (Notenzahl und erste Noten), ergänzt um die Statistiken."""
+    lines = [f"Die Datei enthält {stats['total_notes']} Noten."]
+    for note in stats['first_notes']:
+        lines.append(f"Note: {note['pitch']}, Startzeit: {note['start']}, Dauer: {note['duration']}")
+    if stats['total_notes']:
+        lines.append(f"Stimmen: {stats['voices']}, Dauer: {stats['duration_seconds']:.2f} s, "
+                     f"Notendichte: {stats['notes_per_second']:.2f} Noten/s")
+        lines.append(f"Umfang: {pitch_name(stats['lowest_pitch'])} bis {pitch_name(stats['highest_pitch'])}")
+        lines.append('Tonklassen: ' + ', '.join(f'{name}={count}'
+                                                 for name, count in stats['pitch_class_histogram'].items()))
+        lines.append('Akkorde: ' + ', '.join(f'{name}={count}' for name, count in stats['chord_qualities'].items()))
+        lines.append(f"Stimmkreuzungen: {stats['voice_crossings']}")
+    lines.append("Analyse abgeschlossen.")
+    return '\n'.join(lines) + '\n'
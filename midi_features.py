@@ -0,0 +1,217 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from midi_analysis import parse_midi
+
+logger = logging.getLogger(__name__)
+
+# File extensions picked up when scanning a MIDI folder
+MIDI_EXTENSIONS = ('.mid', '.midi')
+
+# Files parsed and featurized together by one pool task
+MIDI_CHUNKSIZE = 64
+
+# Melodic intervals within a voice, in semitones; larger leaps share the last bin
+MAX_INTERVAL = 12
+
+# Bin edges (quarter notes) for note durations and inter-onset intervals:
+# below a 32nd, 32nd, 16th, 8th, quarter, half, whole, longer
+RHYTHM_EDGES = np.array([0.125, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0])
+
+# Scalar statistics appended after the histograms
+STAT_NAMES = ('polyphony_mean', 'polyphony_max', 'polyphony_std', 'polyphonic_fraction',
+              'notes_per_quarter', 'pitch_mean', 'pitch_std', 'pitch_range')
+
+# Column layout of a feature row
+FEATURE_GROUPS = (
+    ('pitch_class', 12),
+    ('interval', MAX_INTERVAL + 1),
+    ('duration', len(RHYTHM_EDGES) + 1),
+    ('inter_onset', len(RHYTHM_EDGES) + 1),
+    ('stats', len(STAT_NAMES)),
+)
+MIDI_FEATURE_SIZE = sum(size for _, size in FEATURE_GROUPS)
+
+
+def pack_notes(note_arrays):
+    """
+    Concatenate the NoteArrays of several files into flat arrays plus a file index per note.
+
+    Returns (file, pitch, start, end, voice); times are whatever unit the
+    NoteArrays use (quarters for midi_features).
+    """
+    sizes = [len(notes) for notes in note_arrays]
+    file = np.repeat(np.arange(len(note_arrays)), sizes)
+    columns = [np.concatenate([getattr(notes, name) for notes in note_arrays]) if note_arrays else np.zeros(0)
+               for name in ('pitch', 'start', 'end', 'voice')]
+    pitch, start, end, voice = columns
+    return file, pitch.astype(np.int64), start.astype(np.float64), end.astype(np.float64), voice.astype(np.int64)
+
+
+def _histogram(file, values, n_files, n_bins):
+    # One normalised histogram row per file, all files in one bincount
+    counts = np.bincount(file * n_bins + values, minlength=n_files * n_bins).reshape(n_files, n_bins)
+    totals = counts.sum(axis=1, keepdims=True)
+    return counts / np.maximum(totals, 1)
+
+
+def _segment_mean_std(file, values, n_files):
+    counts = np.maximum(np.bincount(file, minlength=n_files), 1)
+    mean = np.bincount(file, weights=values, minlength=n_files) / counts
+    variance = np.bincount(file, weights=(values - mean[file]) ** 2, minlength=n_files) / counts
+    return mean, np.sqrt(variance)
+
+
+def features_from_packed(file, pitch, start, end, voice, n_files):
+    """
+    Feature matrix (n_files, MIDI_FEATURE_SIZE) from packed notes, see FEATURE_GROUPS.
+
+    Every file must contain at least one note. All statistics are computed for
+    all files at once; nothing loops over files or notes in Python.
+    """
+    if n_files == 0:
+        return np.zeros((0, MIDI_FEATURE_SIZE), dtype=np.float32)
+    n_bins = len(RHYTHM_EDGES) + 1
+
+    # Melodic intervals between consecutive notes of the same voice
+    order = np.lexsort((start, voice, file))
+    same_voice = (file[order][1:] == file[order][:-1]) & (voice[order][1:] == voice[order][:-1])
+    leaps = np.minimum(np.abs(np.diff(pitch[order])), MAX_INTERVAL)[same_voice]
+    interval_hist = _histogram(file[order][1:][same_voice], leaps, n_files, MAX_INTERVAL + 1)
+
+    # Distinct onsets per file and the gaps between them
+    order = np.lexsort((start, file))
+    onset_file, onset = file[order], start[order]
+    distinct = np.ones(len(onset), dtype=bool)
+    distinct[1:] = (onset_file[1:] != onset_file[:-1]) | (onset[1:] != onset[:-1])
+    onset_file, onset = onset_file[distinct], onset[distinct]
+    same_file = onset_file[1:] == onset_file[:-1]
+    gaps = np.diff(onset)[same_file]
+    ioi_hist = _histogram(onset_file[1:][same_file], np.digitize(gaps, RHYTHM_EDGES), n_files, n_bins)
+
+    # Notes sounding at each onset: starts so far minus ends so far. Times are offset per
+    # file so one sorted key covers all files; earlier files cancel out of the difference.
+    span = float(end.max()) + 1.0
+    start_keys = np.sort(file * span + start)
+    end_keys = np.sort(file * span + end)
+    onset_keys = onset_file * span + onset
+    sounding = (np.searchsorted(start_keys, onset_keys, side='right')
+                - np.searchsorted(end_keys, onset_keys, side='right')).astype(np.float64)
+    polyphony_mean, polyphony_std = _segment_mean_std(onset_file, sounding, n_files)
+    polyphony_max = np.zeros(n_files)
+    np.maximum.at(polyphony_max, onset_file, sounding)
+    polyphonic_fraction = _segment_mean_std(onset_file, (sounding > 1).astype(np.float64), n_files)[0]
+
+    n_notes = np.bincount(file, minlength=n_files)
+    first, last = np.full(n_files, np.inf), np.zeros(n_files)
+    np.minimum.at(first, file, start)
+    np.maximum.at(last, file, end)
+    low, high = np.full(n_files, 127), np.zeros(n_files, dtype=np.int64)
+    np.minimum.at(low, file, pitch)
+    np.maximum.at(high, file, pitch)
+    pitch_mean, pitch_std = _segment_mean_std(file, pitch.astype(np.float64), n_files)
+
+    stats = np.stack([
+        polyphony_mean,
+        polyphony_max,
+        polyphony_std,
+        polyphonic_fraction,
+        n_notes / np.maximum(last - first, 1e-9),
+        pitch_mean / 127.0,
+        pitch_std / 127.0,
+        (high - low) / 127.0,
+    ], axis=1)
+
+    columns = [
+        _histogram(file, pitch % 12, n_files, 12),
+        interval_hist,
+        _histogram(file, np.digitize(end - start, RHYTHM_EDGES), n_files, n_bins),
+        ioi_hist,
+        stats,
+    ]
+    return np.concatenate(columns, axis=1).astype(np.float32)
+
+
+def midi_features(note_arrays):
+    """Feature matrix for a list of NoteArrays (times in quarter notes), one row per entry."""
+    return features_from_packed(*pack_notes(note_arrays), n_files=len(note_arrays))
+
+
+def _featurize_chunk(file_paths):
+    # Runs inside pool workers: parse each file, then featurize the whole chunk at once.
+    # Returns (vector, error) per path; one bad file does not fail the chunk.
+    parsed = []
+    results = [None] * len(file_paths)
+    for i, file_path in enumerate(file_paths):
+        try:
+            with open(file_path, 'rb') as f:
+                notes = parse_midi(f.read(), unit='quarters')
+            if len(notes) == 0:
+                raise ValueError('MIDI file contains no notes')
+        except Exception as e:
+            results[i] = (None, f'{type(e).__name__}: {e}')
+            continue
+        parsed.append((i, notes))
+
+    matrix = midi_features([notes for _, notes in parsed])
+    for (i, _), vector in zip(parsed, matrix):
+        results[i] = (vector, None)
+    return results
+
+
+def list_midi_files(directory):
+    """MIDI files in `directory`, sorted so results have a stable order."""
+    return [
+        os.path.join(directory, file_name)
+        for file_name in sorted(os.listdir(directory))
+        if file_name.lower().endswith(MIDI_EXTENSIONS)
+    ]
+
+
+def extract_midi_files(file_paths, workers=1, chunksize=MIDI_CHUNKSIZE):
+    """
+    Featurize MIDI files, optionally on a process pool.
+
+    Returns (paths, features, errors): the successfully processed paths, their
+    features as one (n, MIDI_FEATURE_SIZE) float32 matrix in input order, and a
+    list of (path, message) for failures. workers=None uses one process per
+    CPU; workers=1 runs in-process. Each task handles `chunksize` files.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = [file_paths[i:i + chunksize] for i in range(0, len(file_paths), chunksize)]
+    if workers <= 1 or len(chunks) <= 1:
+        chunk_results = list(map(_featurize_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(_featurize_chunk, chunks))
+
+    paths = []
+    rows = []
+    errors = []
+    for file_path, (vector, error) in zip(file_paths, (result for chunk in chunk_results for result in chunk)):
+        if error is None:
+            paths.append(file_path)
+            rows.append(vector)
+        else:
+            logger.warning('Error processing file %s: %s', file_path, error)
+            errors.append((file_path, error))
+    features = np.stack(rows) if rows else np.zeros((0, MIDI_FEATURE_SIZE), dtype=np.float32)
+    return paths, features, errors
+
+
+def process_midi_directory(directory, label, workers=1, chunksize=MIDI_CHUNKSIZE, errors=None):
+    """
+    Featurize every MIDI file in `directory` and label them all with `label`.
+
+    Failed files are skipped; pass a list as `errors` to receive (path, message)
+    pairs for them.
+    """
+    _, features, failed = extract_midi_files(list_midi_files(directory), workers=workers, chunksize=chunksize)
+    if errors is not None:
+        errors.extend(failed)
+    labels = [label] * len(features)
+    return features, labels
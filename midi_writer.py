@@ -0,0 +1,127 @@
+import io
+import struct
+
+import numpy as np
+
+from chord_engine import DIVISIONS, ChordBatch
+
+# Auflösung der Datei; ein Vielfaches von DIVISIONS, damit alle Längen ganzzahlig bleiben
+TICKS_PER_QUARTER = 480
+
+DEFAULT_TEMPO_BPM = 120
+DEFAULT_VELOCITY = 90
+
+# General-MIDI-Programme (0-basiert) für die Instrumentnamen von ChordSequence.to_score
+GM_PROGRAMS = {'Trumpet': 56, 'Trombone': 57, 'Tuba': 58, 'Horn': 60, 'Piano': 0}
+
+# Kanal 10 (Index 9) ist in General MIDI für Schlagzeug reserviert
+_CHANNELS = [channel for channel in range(16) if channel != 9]
+
+
+def _varlen(value):
+    # Variable-length quantity: 7 Bit pro Byte, höchstes Bit markiert Folgebytes
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+
+def _chunk(kind, data):
+    return kind + struct.pack('>I', len(data)) + data
+
+
+def _meta(delta, kind, data):
+    return _varlen(delta) + bytes([0xFF, kind]) + _varlen(len(data)) + data
+
+
+def _conductor_track(tempo_bpm):
+    events = bytearray()
+    events += _meta(0, 0x58, bytes([4, 2, 24, 8]))  # 4/4
+    events += _meta(0, 0x51, struct.pack('>I', round(60_000_000 / tempo_bpm))[1:])
+    events += _meta(0, 0x2F, b'')
+    return _chunk(b'MTrk', bytes(events))
+
+
+def _varlen_columns(values):
+    # _varlen für ein ganzes Array: (..., 4) Bytes mit Folgebit plus Maske der tatsächlich geschriebenen Bytes
+    values = np.asarray(values, dtype=np.int64)
+    if values.min(initial=0) < 0 or values.max(initial=0) >= 1 << 28:
+        raise ValueError('MIDI delta times must be in 0 .. 2**28 - 1')
+    groups = (values[..., None] >> np.array([21, 14, 7, 0])) & 0x7F
+    groups[..., :3] |= 0x80
+    n_bytes = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+    valid = np.arange(4) >= 4 - n_bytes[..., None]
+    return groups.astype(np.uint8), valid
+
+
+def _note_events(pitches, onsets, lengths, channel, velocity):
+    # Note-Ereignisse einer einstimmigen Stimme für m Folgen auf einmal; Eingaben haben die Form (m, n).
+    # Pro Note: Note-on nach der Pause seit dem letzten Note-off, Note-off nach der Notenlänge.
+    # Die Ereignisse werden als Zeilen fester Breite gebaut und über die Maske zusammengeschoben.
+    # Gibt (Bytes aller Folgen hintereinander, Bytes pro Folge) zurück.
+    ends = onsets + lengths
+    gaps = onsets - np.concatenate([np.zeros((len(onsets), 1), dtype=np.int64), ends[:, :-1]], axis=1)
+    gap_bytes, gap_valid = _varlen_columns(gaps)
+    length_bytes, length_valid = _varlen_columns(lengths)
+
+    fixed = np.ones(pitches.shape + (3,), dtype=bool)
+    note_on = np.stack([np.full(pitches.shape, 0x90 | channel), pitches, np.full(pitches.shape, velocity)], axis=-1)
+    note_off = np.stack([np.full(pitches.shape, 0x80 | channel), pitches, np.zeros(pitches.shape)], axis=-1)
+    rows = np.concatenate([gap_bytes, note_on.astype(np.uint8), length_bytes, note_off.astype(np.uint8)], axis=-1)
+    keep = np.concatenate([gap_valid, fixed, length_valid, fixed], axis=-1)
+    return rows[keep].tobytes(), keep.sum(axis=(1, 2))
+
+
+def encode_midi_batch(batch, instrument='Trumpet', tempo_bpm=DEFAULT_TEMPO_BPM, velocity=DEFAULT_VELOCITY):
+    """
+    Kodiert alle Folgen einer ChordBatch als Standard MIDI Files; gibt eine Liste von Bytes zurück.
+
+    Die Noten aller Folgen werden pro Stimme in einem vektorisierten Schritt
+    kodiert; pro Folge werden danach nur noch die Spuren zusammengesetzt.
+    """
+    n_scores, _, n_voices = batch.pitches.shape
+    if n_voices > len(_CHANNELS):
+        raise ValueError(f'At most {len(_CHANNELS)} voices fit on separate MIDI channels')
+    scale = TICKS_PER_QUARTER // DIVISIONS
+    lengths = batch.durations.astype(np.int64) * scale
+    onsets = np.cumsum(lengths, axis=1) - lengths
+    program = GM_PROGRAMS[instrument]
+
+    voices = []
+    for voice in range(n_voices):
+        channel = _CHANNELS[voice]
+        data, sizes = _note_events(batch.pitches[:, :, voice], onsets, lengths, channel, velocity)
+        prefix = _meta(0, 0x03, instrument.encode('ascii')) + _varlen(0) + bytes([0xC0 | channel, program])
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).tolist()
+        voices.append((prefix, data, offsets))
+    end_of_track = _meta(0, 0x2F, b'')
+
+    head = _chunk(b'MThd', struct.pack('>HHH', 1, n_voices + 1, TICKS_PER_QUARTER)) + _conductor_track(tempo_bpm)
+    files = []
+    for i in range(n_scores):
+        tracks = [head]
+        for prefix, data, offsets in voices:
+            tracks.append(_chunk(b'MTrk', prefix + data[offsets[i]:offsets[i + 1]] + end_of_track))
+        files.append(b''.join(tracks))
+    return files
+
+
+def encode_midi(sequence, instrument='Trumpet', tempo_bpm=DEFAULT_TEMPO_BPM, velocity=DEFAULT_VELOCITY):
+    """
+    Kodiert eine ChordSequence direkt als Standard MIDI File (Format 1) und gibt die Bytes zurück.
+
+    Spur 0 enthält Tempo und Taktart, danach folgt eine Spur pro Stimme auf
+    eigenem Kanal mit Programmwechsel auf `instrument`. music21 wird dafür
+    nicht benötigt.
+    """
+    batch = ChordBatch(pitches=sequence.pitches[None], steps=sequence.steps[None], durations=sequence.durations[None])
+    return encode_midi_batch(batch, instrument=instrument, tempo_bpm=tempo_bpm, velocity=velocity)[0]
+
+
+def midi_buffer(sequence, **kwargs):
+    """encode_midi als zurückgespulter BytesIO, z. B. für send_file."""
+    buffer = io.BytesIO(encode_midi(sequence, **kwargs))
+    buffer.seek(0)
+    return buffer
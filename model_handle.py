@@ -0,0 +1,52 @@
+import os
+import threading
+import time
+
+# Seconds between checks of the model file for changes
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+class ModelHandle:
+    """
+    A model file loaded once per process and reloaded when the file changes.
+
+    `loader(path)` builds whatever the caller serves from the file. The file
+    is stat'ed at most every RELOAD_CHECK_INTERVAL seconds; a new result is
+    swapped in atomically, so requests in flight finish on the model they
+    started with.
+    """
+
+    def __init__(self, model_path, loader):
+        self.model_path = model_path
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._model = None
+        self._signature = None
+        self._checked_at = 0.0
+        self.reloads = 0
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.model_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self):
+        """What the loader returned for the current file; raises FileNotFoundError if there is none yet."""
+        now = time.monotonic()
+        if self._model is not None and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return self._model
+
+        with self._lock:
+            self._checked_at = now
+            signature = self._file_signature()
+            if signature is None:
+                if self._model is not None:
+                    return self._model
+                raise FileNotFoundError(f'No trained model at {self.model_path}')
+            if signature != self._signature:
+                self._model = self._loader(self.model_path)
+                self._signature = signature
+                self.reloads += 1
+            return self._model
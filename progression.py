@@ -0,0 +1,300 @@
+import hashlib
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from chord_engine import (CHORD_TYPES, KEY_TABLES, LENGTH_DIVISIONS, MODE_SCALES, MODES, N_CHORD_STATES,
+                          STATE_BY_MASK, ChordBatch, chord_state, new_seed, uniform_draws, voicing_table)
+from midi_analysis import parse_midi
+from midi_features import MIDI_CHUNKSIZE, list_midi_files
+
+logger = logging.getLogger(__name__)
+
+# Höchste Ordnung der n-Gramme: Ordnung 3 sind bereits 2 * 48**3 Zähler
+MAX_ORDER = 3
+DEFAULT_ORDER = 2
+
+# Version des Dateiformats von ProgressionModel.save
+MODEL_VERSION = 1
+
+# Tonartprofile nach Krumhansl-Kessler (Dur, Moll), ab der Tonika
+KEY_PROFILES = np.array([
+    [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88],
+    [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17],
+])
+
+
+def estimate_key(notes):
+    """(Tonklasse der Tonika, Index in MODES) nach Krumhansl-Schmuckler, gewichtet mit der Notendauer."""
+    durations = np.bincount(notes.pitch % 12, weights=notes.end - notes.start, minlength=12)
+    # Korrelation des Histogramms mit allen 24 rotierten Profilen auf einmal
+    profiles = KEY_PROFILES[:, (np.arange(12)[None, :] - np.arange(12)[:, None]) % 12]  # (Modus, Tonika, Tonklasse)
+    centered = profiles - profiles.mean(axis=2, keepdims=True)
+    histogram = durations - durations.mean()
+    scores = (centered @ histogram) / (np.linalg.norm(centered, axis=2) * max(np.linalg.norm(histogram), 1e-12))
+    mode, tonic = np.unravel_index(np.argmax(scores), scores.shape)
+    return int(tonic), int(mode)
+
+
+def chord_states(notes, tonic):
+    """
+    Folge der Akkordzustände (relativ zu `tonic`) an den Einsatzzeitpunkten der Noten.
+
+    Klingen an einem Einsatz genau die Töne eines Dreiklangs aus CHORD_TYPES,
+    zählt er als Akkord; andere Zeitpunkte werden übersprungen, direkt
+    wiederholte Akkorde zusammengefasst.
+    """
+    onsets = np.unique(notes.start)
+    pitch_classes = notes.pitch % 12
+    # Klingende Noten pro Tonklasse und Einsatz über Differenzen und kumulierte Summe
+    changes = np.zeros((len(onsets) + 1, 12), dtype=np.int32)
+    np.add.at(changes, (np.searchsorted(onsets, notes.start), pitch_classes), 1)
+    np.add.at(changes, (np.searchsorted(onsets, notes.end), pitch_classes), -1)
+    sounding = np.cumsum(changes, axis=0)[:-1] > 0
+    masks = sounding @ (1 << np.arange(12))
+
+    absolute = STATE_BY_MASK[masks]
+    absolute = absolute[absolute >= 0]
+    if len(absolute):
+        absolute = absolute[np.concatenate([[True], absolute[1:] != absolute[:-1]])]
+    n_types = len(CHORD_TYPES)
+    return chord_state((absolute // n_types - tonic) % 12, absolute % n_types).astype(np.int16)
+
+
+def _ngram_counts(progressions, order):
+    # (Anfangszähler (Modi, Zustände), n-Gramm-Zähler (Modi, Kontexte, Zustände)) für [(Modus, Zustände)]
+    n_modes = len(MODES)
+    n_contexts = N_CHORD_STATES ** (order - 1)
+    progressions = [(mode, states) for mode, states in progressions if len(states)]
+    initial = np.zeros((n_modes, N_CHORD_STATES), dtype=np.uint32)
+    counts = np.zeros((n_modes, n_contexts, N_CHORD_STATES), dtype=np.uint32)
+    if not progressions:
+        return initial, counts
+
+    modes = np.array([mode for mode, _ in progressions])
+    lengths = np.array([len(states) for _, states in progressions])
+    states = np.concatenate([states for _, states in progressions]).astype(np.int64)
+    sequence = np.repeat(np.arange(len(progressions)), lengths)
+    firsts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    np.add.at(initial, (modes, states[firsts]), 1)
+
+    if len(states) >= order:
+        # Alle Fenster der verketteten Folgen; Fenster über eine Folgengrenze hinweg fallen weg
+        windows = np.lib.stride_tricks.sliding_window_view(states, order)
+        owners = np.lib.stride_tricks.sliding_window_view(sequence, order)
+        inside = owners[:, 0] == owners[:, -1]
+        index = windows[inside] @ (N_CHORD_STATES ** np.arange(order - 1, -1, -1))
+        flat = modes[owners[inside, 0]] * N_CHORD_STATES ** order + index
+        counts += np.bincount(flat, minlength=counts.size).reshape(counts.shape).astype(np.uint32)
+    return initial, counts
+
+
+def _diatonic_states(mode):
+    # Die sieben leitereigenen Dreiklänge des Modus als Zustände, für Modelle ohne Daten
+    table = KEY_TABLES[('C', mode)]
+    return np.unique(chord_state(MODE_SCALES[mode][table.degrees], table.types))
+
+
+def _cumulative(counts, fallback):
+    # Zeilenweise kumulierte Wahrscheinlichkeiten; leere Zeilen übernehmen `fallback` (gleiche Form).
+    # Geteilt durch den letzten Wert, damit jede Zeile exakt bei 1.0 endet.
+    cumulative = np.cumsum(counts, axis=-1, dtype=np.float64)
+    total = cumulative[..., -1:]
+    return np.where(total > 0, cumulative / np.maximum(total, 1), fallback)
+
+
+class ProgressionModel:
+    """
+    n-Gramm-Modell über Akkordzustände (Grundton relativ zur Tonika, Akkordtyp), getrennt nach Dur und Moll.
+
+    Gespeichert werden nur die Zähler als uint32-Arrays: `initial` (Modi,
+    Zustände) für den ersten Akkord und `counts` (Modi, Kontexte, Zustände)
+    mit den `order - 1` vorherigen Akkorden als Kontext (Basis N_CHORD_STATES,
+    ältester Akkord zuerst). Für das Ziehen werden daraus einmal kumulierte
+    Verteilungen aller Ordnungen berechnet; unbekannte Kontexte fallen auf die
+    nächstkleinere Ordnung zurück, ein Modus ohne Daten auf die leitereigenen
+    Dreiklänge.
+    """
+
+    def __init__(self, counts, initial):
+        self.counts = counts
+        self.initial = initial
+        self.order = int(round(np.log(counts.shape[1]) / np.log(N_CHORD_STATES))) + 1
+        if not 1 <= self.order <= MAX_ORDER:
+            raise ValueError(f'order must be 1..{MAX_ORDER}')
+        self._start_table, self._tables = self._cumulative_tables()
+        self._digest = self._hash_counts()
+
+    @classmethod
+    def fit(cls, progressions, order=DEFAULT_ORDER):
+        """Modell aus [(Modus-Index, Zustände), ...], z. B. von chord_states."""
+        if not 1 <= order <= MAX_ORDER:
+            raise ValueError(f'order must be 1..{MAX_ORDER}')
+        initial, counts = _ngram_counts(progressions, order)
+        return cls(counts, initial)
+
+    def digest(self):
+        """Kurzer Hash der Zähler, z. B. als Teil eines Cache-Schlüssels; einmal beim Anlegen berechnet."""
+        return self._digest
+
+    def _hash_counts(self):
+        hasher = hashlib.sha256(np.asarray(self.order).tobytes())
+        hasher.update(np.ascontiguousarray(self.initial).tobytes())
+        hasher.update(np.ascontiguousarray(self.counts).tobytes())
+        return hasher.hexdigest()[:16]
+
+    def __add__(self, other):
+        if self.order != other.order:
+            raise ValueError('Cannot combine models of different order')
+        return ProgressionModel(self.counts + other.counts, self.initial + other.initial)
+
+    def _cumulative_tables(self):
+        # Kumulierte Verteilung des ersten Akkords (Modi, Zustände) und
+        # tables[k] für Ordnung k + 1: (Modi, N_CHORD_STATES ** k, Zustände)
+        uniform = np.zeros((len(MODES), 1, N_CHORD_STATES))
+        for mode_index, mode in enumerate(MODES):
+            uniform[mode_index, 0, _diatonic_states(mode)] = 1.0
+        lower = _cumulative(uniform, 0.0)
+
+        marginals = [self.counts.astype(np.float64)]
+        for _ in range(self.order - 1):
+            # Ältesten Kontextakkord heraussummieren: Ordnung k -> k - 1
+            previous = marginals[0]
+            marginals.insert(0, previous.reshape(len(MODES), N_CHORD_STATES, -1, N_CHORD_STATES).sum(axis=1))
+
+        tables = []
+        for k, counts in enumerate(marginals):
+            # Rückfall auf den Kontext ohne den ältesten Akkord: Index modulo N_CHORD_STATES ** (k - 1)
+            suffix = np.arange(counts.shape[1]) % lower.shape[1]
+            lower = _cumulative(counts, lower[:, suffix])
+            tables.append(lower)
+        return _cumulative(self.initial[:, None, :], tables[0])[:, 0], tables
+
+    def sample_states(self, uniforms, mode='major'):
+        """
+        Zustände (Folgen, Länge) aus gleichverteilten Zahlen (Folgen, Länge) in [0, 1).
+
+        Pro Schritt wird für alle Folgen gleichzeitig die Zeile ihres Kontexts
+        nachgeschlagen und der erste Zustand gewählt, dessen kumulierte
+        Wahrscheinlichkeit die Zufallszahl übersteigt.
+        """
+        mode_index = MODES.index(mode)
+        n_sequences, length = uniforms.shape
+        states = np.zeros((n_sequences, length), dtype=np.int64)
+        if length == 0:
+            return states
+        states[:, 0] = (self._start_table[mode_index][None, :] <= uniforms[:, :1]).sum(axis=1)
+        context = np.zeros(n_sequences, dtype=np.int64)
+        for t in range(1, length):
+            k = min(t, self.order - 1)
+            context = (context * N_CHORD_STATES + states[:, t - 1]) % N_CHORD_STATES ** k
+            rows = self._tables[k][mode_index][context]
+            states[:, t] = (rows <= uniforms[:, t:t + 1]).sum(axis=1)
+        return states
+
+    def save(self, path):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, version=np.asarray(MODEL_VERSION), counts=self.counts, initial=self.initial)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['version']) != MODEL_VERSION:
+                raise ValueError(f'Unsupported progression model version {int(data["version"])}')
+            return cls(data['counts'], data['initial'])
+
+
+def _progressions_chunk(file_paths, order):
+    # Läuft in Pool-Prozessen: Zähler für alle Dateien des Pakets plus (Pfad, Fehler) für die übrigen
+    progressions = []
+    errors = []
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'rb') as f:
+                notes = parse_midi(f.read(), unit='quarters')
+            if len(notes) == 0:
+                raise ValueError('MIDI file contains no notes')
+            tonic, mode = estimate_key(notes)
+            progressions.append((mode, chord_states(notes, tonic)))
+        except Exception as e:
+            errors.append((file_path, f'{type(e).__name__}: {e}'))
+    initial, counts = _ngram_counts(progressions, order)
+    return initial, counts, errors
+
+
+def train_progression_model(file_paths, order=DEFAULT_ORDER, workers=1, chunksize=MIDI_CHUNKSIZE):
+    """
+    Trainiert ein ProgressionModel auf MIDI-Dateien; gibt (Modell, [(Pfad, Fehler)]) zurück.
+
+    Pro Datei werden Tonart und Akkordfolge bestimmt; jedes Paket von
+    `chunksize` Dateien liefert nur seine Zählerarrays, die aufsummiert
+    werden. workers=None nutzt einen Prozess pro CPU.
+    """
+    if not 1 <= order <= MAX_ORDER:
+        raise ValueError(f'order must be 1..{MAX_ORDER}')
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = [file_paths[i:i + chunksize] for i in range(0, len(file_paths), chunksize)]
+    initial, counts = _ngram_counts([], order)
+    errors = []
+
+    def add(result):
+        chunk_initial, chunk_counts, chunk_errors = result
+        np.add(initial, chunk_initial, out=initial)
+        np.add(counts, chunk_counts, out=counts)
+        for file_path, error in chunk_errors:
+            logger.warning('Error processing file %s: %s', file_path, error)
+        errors.extend(chunk_errors)
+
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            add(_progressions_chunk(chunk, order))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(_progressions_chunk, chunks, [order] * len(chunks)):
+                add(result)
+    return ProgressionModel(counts, initial), errors
+
+
+def generate_progression_batch(model, count, length=64, key='C', mode='major', seed=None, start=0):
+    """
+    `count` Akkordfolgen aus dem ProgressionModel in der Tonart `key` als ChordBatch.
+
+    Pro Akkord werden drei gleichverteilte Zahlen gezogen (Folgezustand,
+    Voicing, Länge), mit denselben Blöcken wie generate_chord_batch; gleicher
+    seed ergibt dieselben Partituren, `start` teilt große Batches auf. Das
+    Voicing wird gleichverteilt aus der VoicingTable der Tonart gewählt.
+    """
+    if mode not in MODES:
+        raise ValueError(f'Unknown mode: {mode!r}, expected one of {MODES}')
+    if seed is None:
+        seed = new_seed()
+    table = voicing_table(key)
+    uniforms = uniform_draws(seed, count, 3, length, start)
+    states = model.sample_states(uniforms[:, 0], mode)
+
+    first = table.offsets[states]
+    n_voicings = table.offsets[states + 1] - first
+    rows = first + (uniforms[:, 1] * n_voicings).astype(np.int64)
+    lengths = (uniforms[:, 2] * len(LENGTH_DIVISIONS)).astype(np.int64)
+    return ChordBatch(pitches=table.pitches[rows], steps=table.steps[rows], durations=LENGTH_DIVISIONS[lengths])
+
+
+if __name__ == '__main__':
+    # python progression.py <midi_ordner> <modell.npz> [ordnung]
+    if len(sys.argv) < 3:
+        print('Usage: python progression.py <midi_folder> <model.npz> [order]')
+        sys.exit(1)
+    trained, failed = train_progression_model(list_midi_files(sys.argv[1]),
+                                              order=int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_ORDER,
+                                              workers=None)
+    trained.save(sys.argv[2])
+    print(f'{int(trained.initial.sum())} Folgen, {int(trained.counts.sum())} Übergänge, {len(failed)} Fehler')
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+# Version des Eintragsformats und der Generierung; ändert sich die Ausgabe, werden alte Einträge nicht mehr getroffen
+CACHE_VERSION = 3
+
+
+def cache_key(**params):
+    """
+    Kanonischer Schlüssel für Generierungsparameter: sortiertes JSON, als SHA-256.
+
+    Reihenfolge und Schreibweise der Parameter spielen so keine Rolle.
+    """
+    canonical = json.dumps({'v': CACHE_VERSION, **params}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _pack(parts):
+    # {name: bytes} -> Längenpräfix + JSON-Kopf mit den Längen + Daten hintereinander
+    header = json.dumps({name: len(data) for name, data in parts.items()}).encode('utf-8')
+    return struct.pack('>I', len(header)) + header + b''.join(parts.values())
+
+
+def _unpack(blob):
+    (header_size,) = struct.unpack_from('>I', blob)
+    sizes = json.loads(blob[4:4 + header_size])
+    parts = {}
+    offset = 4 + header_size
+    for name, size in sizes.items():
+        parts[name] = blob[offset:offset + size]
+        offset += size
+    return parts
+
+
+class ResultCache:
+    """
+    LRU-Cache für fertige Ergebnisse ({name: bytes}) mit Größenlimit in Bytes.
+
+    Im Speicher hält er höchstens `max_bytes`; mit `directory` werden Einträge
+    zusätzlich als Dateien abgelegt (höchstens `max_disk_bytes`, älteste
+    Zugriffe zuerst entfernt), so dass sie Neustarts überleben und von allen
+    Worker-Prozessen geteilt werden. Dateien werden per Umbenennung atomar
+    geschrieben.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._trim_disk()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.bin')
+
+    def get(self, key):
+        """Gespeicherte Teile zum Schlüssel oder None."""
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _unpack(blob)
+
+        blob = self._read_disk(key)
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, blob)
+        return _unpack(blob)
+
+    def put(self, key, parts):
+        blob = _pack(parts)
+        with self._lock:
+            self._remember(key, blob)
+        self._write_disk(key, blob)
+
+    def _remember(self, key, blob):
+        # Aufrufer hält self._lock
+        if len(blob) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = blob
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            os.utime(path)  # Zugriffszeit für die LRU-Reihenfolge auf der Platte
+        except FileNotFoundError:
+            return None
+        return blob
+
+    def _write_disk(self, key, blob):
+        if self.directory is None or len(blob) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += len(blob) - replaced
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        # Andere Prozesse schreiben mit: Größe und Reihenfolge immer frisch vom Verzeichnis lesen
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.bin'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.disk_evictions += 1
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk_bytes': self._disk_bytes if self.directory is not None else None,
+            }
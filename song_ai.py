@@ -1,34 +1,99 @@
 import os
 import shutil
-import json
 import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from functools import wraps
 import numpy as np
-import librosa
-from flask import Flask, request, jsonify, send_file, abort, render_template
+from flask import Flask, request, jsonify, send_file, render_template
+from werkzeug.utils import secure_filename
+from key_store import ApiKeyStore, SqliteKeyBackend
+from model_handle import ModelHandle
+from zip_ingest import ZipLimitError, extract_audio, featurize_audio, load_feature_file, save_feature_file
+from audio_features import (DEFAULT_FEATURE_CONFIG, FEATURE_SIZE, extract_features_from_bytes, features_from_signal,
+                            load_feature_config, open_feature_cache, process_directory, save_feature_config)
+from dataset_store import DatasetStore
+from training_jobs import JobManager, keras_progress_callback
+from classifier import MicroBatcher, export_numpy_model, export_path_for, load_classifier
 
 app = Flask(__name__)
 
-# Path for the API keys file
+# Path for the API keys file (legacy JSON registry, imported into the database once)
 API_KEYS_FILE = 'api_keys.json'
 
+# Path for the API keys database
+API_KEYS_DB = 'api_keys.db'
+
 # Admin key (creator)
 ADMIN_API_KEY = 'your_admin_key_here'  # Replace with a secure key
 
 # Path to the generated music file (to be replaced with your actual music generation logic)
 GENERATED_MUSIC_FILE = 'generated_music.wav'
 
-# 1. Utility function to load API keys from JSON file
+# Worker processes for feature extraction during training (None = one per CPU);
+# half the CPUs by default so background training leaves room for serving requests
+FEATURE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Training jobs allowed to run at the same time; further jobs wait in the queue
+TRAINING_CONCURRENCY = 1
+
+# Labelled feature vectors from all uploads so far; every /train retrains on all of them
+DATASET_DIR = 'dataset'
+
+# Maximum epochs for a model trained from scratch, and for continuing from the previous model;
+# training ends earlier once val_loss has not improved for EARLY_STOPPING_PATIENCE epochs
+TRAIN_EPOCHS = 50
+WARM_START_EPOCHS = 5
+EARLY_STOPPING_PATIENCE = 5
+
+# Default batch size and shuffle buffer (rows) of the training input pipeline
+TRAIN_BATCH_SIZE = 32
+SHUFFLE_BUFFER_ROWS = 8192
+
+# Model served by /classify, and how long concurrent requests are collected into one batch
+CLASSIFIER_MODEL_PATH = 'ai_music_classifier.h5'
+CLASSIFY_MAX_BATCH = 64
+CLASSIFY_MAX_WAIT = 0.005
+
+# Appended to the file name of models trained with MIDI features as a second input
+MIDI_MODEL_SUFFIX = '_midi'
+
+# Decoding settings (sample rate, resampler, analysis window) for training and inference
+FEATURE_CONFIG = DEFAULT_FEATURE_CONFIG
+
+# Directory and size cap of the on-disk feature cache (keyed by audio content)
+FEATURE_CACHE_DIR = 'feature_cache'
+FEATURE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Cached view of the key registry, reloaded only when another worker changes it
+api_key_store = ApiKeyStore(SqliteKeyBackend(API_KEYS_DB, legacy_json=API_KEYS_FILE))
+
+# Feature vectors of previously seen training audio, so retraining skips librosa for them
+feature_cache = open_feature_cache(FEATURE_CACHE_DIR, max_bytes=FEATURE_CACHE_MAX_BYTES)
+
+# Background training jobs started by /train
+training_jobs = JobManager(max_concurrent=TRAINING_CONCURRENCY)
+
+# Accumulated training data, one store per feature settings: changing FEATURE_CONFIG
+# starts a fresh store next to the old one instead of mixing (or refusing) rows
+dataset_store = DatasetStore(os.path.join(DATASET_DIR, FEATURE_CONFIG.tag()), FEATURE_SIZE, FEATURE_CONFIG.tag())
+
+# TensorFlow, librosa and soundfile are imported on first use (training, /classify), so a
+# worker serving only the key routes boots without them. Warm pools can call preload(),
+# e.g. from gunicorn's post_worker_init hook, to pay for the imports before taking traffic.
+PRELOAD_TRAINING = False
+
+# Classifier loaded on first use and reloaded after retraining; predictions are micro-batched.
+# Serves the NumPy export of the Keras model, so scoring never touches TensorFlow.
+classifier_model = ModelHandle(export_path_for(CLASSIFIER_MODEL_PATH), loader=load_classifier)
+classifier = MicroBatcher(classifier_model, FEATURE_SIZE, max_batch=CLASSIFY_MAX_BATCH, max_wait=CLASSIFY_MAX_WAIT)
+
+# 1. Utility function to load all API keys
 def load_api_keys():
-    if os.path.exists(API_KEYS_FILE):
-        with open(API_KEYS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    return api_key_store.load()
 
-# 2. Utility function to save API keys to JSON file
+# 2. Utility function to replace all API keys (prefer api_key_store.add/remove for single keys)
 def save_api_keys(api_keys):
-    with open(API_KEYS_FILE, 'w') as f:
-        json.dump(api_keys, f)
+    api_key_store.save(api_keys)
 
 # 3. Generate a new API key
 def generate_api_key():
@@ -39,9 +104,8 @@ def require_api_key(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         api_key = request.headers.get('x-api-key')
-        api_keys = load_api_keys()
-        
-        if api_key not in api_keys and api_key != ADMIN_API_KEY:
+
+        if api_key != ADMIN_API_KEY and not api_key_store.is_valid(api_key):
             return jsonify({'error': 'Invalid API key'}), 403
         return f(*args, **kwargs)
     return decorated_function
@@ -56,9 +120,7 @@ def generate_key():
     
     # Generate a new API key and save it
     new_api_key = generate_api_key()
-    api_keys = load_api_keys()
-    api_keys[new_api_key] = True  # True means active
-    save_api_keys(api_keys)
+    api_key_store.add(new_api_key, True)  # True means active
     
     return jsonify({'message': 'API key generated', 'api_key': new_api_key})
 
@@ -84,69 +146,147 @@ def delete_key():
     
     data = request.get_json()
     key_to_delete = data.get('api_key')
-    api_keys = load_api_keys()
 
-    if key_to_delete in api_keys:
-        del api_keys[key_to_delete]
-        save_api_keys(api_keys)
+    if api_key_store.remove(key_to_delete):
         return jsonify({'message': 'API key deleted'})
     else:
         return jsonify({'error': 'API key not found'}), 404
 
+# List API key cache counters (admin only)
+@app.route('/key_stats', methods=['GET'])
+def key_stats():
+    api_key = request.headers.get('x-api-key')
+    if api_key != ADMIN_API_KEY:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return jsonify(api_key_store.stats())
+
 # 8. Example protected route
 @app.route('/protected_route', methods=['GET'])
 @require_api_key
 def protected_route():
     return jsonify({'message': 'You have accessed a protected route'})
 
-# 9. Function to extract features from audio
-def extract_features(audio_file):
-    y, sr = librosa.load(audio_file, sr=None)
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-    mfcc_mean = np.mean(mfcc.T, axis=0)
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    chroma_mean = np.mean(chroma.T, axis=0)
-    spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-    contrast_mean = np.mean(spectral_contrast.T, axis=0)
-    return np.hstack([mfcc_mean, chroma_mean, contrast_mean])
-
-# 10. Process data from directory
-def process_directory(directory, label):
-    features = []
-    labels = []
-    for file_name in os.listdir(directory):
-        if file_name.endswith(".mp3") or file_name.endswith(".wav"):
-            file_path = os.path.join(directory, file_name)
-            try:
-                features.append(extract_features(file_path))
-                labels.append(label)
-            except Exception as e:
-                print(f"Error processing file {file_path}: {e}")
-    return features, labels
-
-# 11. Create the neural network model
-def create_model(input_shape, is_ai_music=False):
-    model = Sequential()
-    model.add(Dense(256, activation='relu', input_shape=input_shape))
-    model.add(Dropout(0.3))
+# 9./10. Feature extraction and directory processing live in audio_features.py
+# (module level so process pool workers can import them without the Flask app)
+
+# 11. Create the neural network model; with midi_shape it takes [audio features, MIDI features]
+# (midi_features.py) as two inputs, concatenated before the first layer
+def create_model(input_shape, is_ai_music=False, midi_shape=None):
+    from tensorflow.keras.models import Model, Sequential
+    from tensorflow.keras.layers import Concatenate, Dense, Dropout, Input
+
+    layers = [Dense(256, activation='relu'), Dropout(0.3)]
     if is_ai_music:
-        model.add(Dense(128, activation='relu'))
-        model.add(Dropout(0.5))
+        layers += [Dense(128, activation='relu'), Dropout(0.5)]
+    else:
+        layers += [Dense(128, activation='relu'), Dropout(0.3)]
+    layers.append(Dense(1, activation='sigmoid'))
+
+    if midi_shape is None:
+        model = Sequential([Input(shape=input_shape)] + layers)
     else:
-        model.add(Dense(128, activation='relu'))
-        model.add(Dropout(0.3))
-    model.add(Dense(1, activation='sigmoid'))
+        inputs = [Input(shape=input_shape, name='audio'), Input(shape=midi_shape, name='midi')]
+        x = Concatenate()(inputs)
+        for layer in layers:
+            x = layer(x)
+        model = Model(inputs, x)
     model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
     return model
 
-# 12. Train the model
-def train_model(X_train, y_train, X_test, y_test, is_ai_music=False):
-    model = create_model((X_train.shape[1],), is_ai_music=is_ai_music)
-    model.fit(X_train, y_train, epochs=50, batch_size=32, validation_data=(X_test, y_test))
+# Write a model, its NumPy export for serving and its feature settings; renames keep
+# /classify from loading a half-written file
+def save_model(model, model_path, feature_config=FEATURE_CONFIG):
+    export_path = export_path_for(model_path)
+    # Record how the features were made so inference decodes audio the same way
+    save_feature_config(feature_config, model_path)
+    save_feature_config(feature_config, export_path)
+    base, ext = os.path.splitext(model_path)
+    tmp_path = f'{base}.tmp{ext}'
+    model.save(tmp_path)
+    os.replace(tmp_path, model_path)
+    export_numpy_model(model, export_path)
+
+# Stop once validation loss stalls and keep the best weights seen
+def early_stopping():
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    return EarlyStopping(monitor='val_loss', patience=EARLY_STOPPING_PATIENCE, restore_best_weights=True)
+
+# 12. Train the model; passing MIDI feature matrices for the same rows (M_train, M_test)
+# trains a two-input model, saved separately from the audio-only classifier
+def train_model(X_train, y_train, X_test, y_test, is_ai_music=False, feature_config=FEATURE_CONFIG, callbacks=None,
+                M_train=None, M_test=None):
+    if (M_train is None) != (M_test is None):
+        raise ValueError('Pass MIDI features for both the training and the test rows, or for neither')
+    if M_train is None:
+        model = create_model((X_train.shape[1],), is_ai_music=is_ai_music)
+    else:
+        model = create_model((X_train.shape[1],), is_ai_music=is_ai_music, midi_shape=(M_train.shape[1],))
+        X_train, X_test = [X_train, M_train], [X_test, M_test]
+    model.fit(X_train, y_train, epochs=TRAIN_EPOCHS, batch_size=TRAIN_BATCH_SIZE, validation_data=(X_test, y_test),
+              callbacks=[early_stopping()] + list(callbacks or []))
     model_path = 'ai_music_classifier.h5' if not is_ai_music else 'ai_music_classifier_ai.h5'
-    model.save(model_path)
+    if M_train is not None:
+        model_path = model_path.replace('.h5', MIDI_MODEL_SUFFIX + '.h5')
+    save_model(model, model_path, feature_config)
     return model_path
 
+# Train on everything in the dataset store, optionally continuing from the served model
+def train_on_dataset(store, warm_start=True, batch_size=TRAIN_BATCH_SIZE, callbacks=None,
+                     model_path=CLASSIFIER_MODEL_PATH, feature_config=FEATURE_CONFIG):
+    n_train, n_validation = store.split_sizes()
+    if n_train == 0:
+        raise ValueError('Not enough training data')
+
+    # Weights are only reusable if the previous model saw the same kind of features
+    warm_start = warm_start and os.path.exists(model_path) and load_feature_config(model_path) == feature_config
+    if warm_start:
+        from tensorflow.keras.models import load_model
+
+        model = load_model(model_path, compile=False)
+        model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+        epochs = WARM_START_EPOCHS
+    else:
+        model = create_model((store.feature_size,))
+        epochs = TRAIN_EPOCHS
+
+    callbacks = list(callbacks or [])
+    validation_data = None
+    if n_validation:
+        validation_data = store.tf_dataset(validation=True, batch_size=batch_size)
+        callbacks.insert(0, early_stopping())
+    model.fit(store.tf_dataset(batch_size=batch_size, shuffle_buffer=SHUFFLE_BUFFER_ROWS),
+              validation_data=validation_data, epochs=epochs, callbacks=callbacks)
+    save_model(model, model_path, feature_config)
+    return model_path, warm_start
+
+# Feature extraction plus training, run as a background job
+def run_training_job(job, folder_path, label, warm_start=True, batch_size=TRAIN_BATCH_SIZE):
+    errors = []
+    features = load_feature_file(folder_path, FEATURE_CONFIG)
+    if features is None:
+        def progress(done, total):
+            job.update(stage='extracting', files_processed=done, files_total=total)
+            job.check_cancelled()
+
+        features, _ = process_directory(folder_path, label, workers=FEATURE_WORKERS, errors=errors,
+                                        cache=feature_cache, config=FEATURE_CONFIG, progress=progress)
+    job.update(failed_files=len(errors))
+    if len(features) == 0:
+        raise ValueError('No valid audio files found in the folder')
+
+    job.check_cancelled()
+    total_rows = dataset_store.append(features, [label] * len(features))
+    job.update(stage='training', dataset_rows=total_rows)
+    model_path, warm_started = train_on_dataset(dataset_store, warm_start=warm_start, batch_size=batch_size,
+                                                callbacks=[keras_progress_callback(job)])
+    # Training stops after the current epoch on cancel; don't report that as done
+    job.check_cancelled()
+    shutil.rmtree(folder_path)
+    return {'model_path': model_path, 'failed_files': len(errors), 'dataset_rows': total_rows,
+            'warm_start': warm_started}
+
 # Flask route to upload folder
 @app.route('/upload_folder', methods=['POST'])
 @require_api_key
@@ -158,14 +298,23 @@ def upload_folder():
     if zipfile.filename == '':
         return jsonify({'error': 'No folder selected'}), 400
 
-    extract_dir = f'uploaded_data/{zipfile.filename.split(".")[0]}'
-    os.makedirs(extract_dir, exist_ok=True)
-    zip_path = os.path.join(extract_dir, zipfile.filename)
-    zipfile.save(zip_path)
-    shutil.unpack_archive(zip_path, extract_dir)
-    os.remove(zip_path)
+    extract_dir = os.path.join('uploaded_data', secure_filename(zipfile.filename.split(".")[0]) or 'upload')
+
+    # The zip is read straight from the upload stream; only audio members are used.
+    # mode=features extracts features in memory and stores just the feature matrix.
+    mode = request.form.get('mode', 'extract')
+    try:
+        if mode == 'features':
+            names, features, errors = featurize_audio(zipfile.stream, FEATURE_CONFIG, workers=FEATURE_WORKERS,
+                                                      cache=feature_cache)
+            save_feature_file(extract_dir, names, features, FEATURE_CONFIG)
+            return jsonify({'message': 'Folder uploaded and featurized', 'folder_path': extract_dir,
+                            'files': len(names), 'failed_files': len(errors)})
+        paths = extract_audio(zipfile.stream, extract_dir)
+    except ZipLimitError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({'message': 'Folder uploaded and extracted', 'folder_path': extract_dir})
+    return jsonify({'message': 'Folder uploaded and extracted', 'folder_path': extract_dir, 'files': len(paths)})
 
 # Route to train AI model
 @app.route('/train', methods=['POST'])
@@ -177,16 +326,87 @@ def train():
     if not folder_path or not os.path.exists(folder_path):
         return jsonify({'error': 'Invalid folder path'}), 400
 
+    try:
+        load_feature_file(folder_path, FEATURE_CONFIG)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     label = 1 if label_type == 'ai' else 0
-    features, labels = process_directory(folder_path, label)
-    if len(features) == 0:
-        return jsonify({'error': 'No valid audio files found in the folder'}), 400
+    # JSON booleans and form-style strings ('false', '0') both work
+    warm_start = str(data.get('warm_start', True)).lower() in ('1', 'true', 'yes')
+    try:
+        batch_size = int(data.get('batch_size', TRAIN_BATCH_SIZE))
+    except (TypeError, ValueError):
+        batch_size = 0
+    if batch_size < 1:
+        return jsonify({'error': 'Invalid batch size'}), 400
+    job = training_jobs.submit('train', run_training_job, folder_path, label, warm_start, batch_size)
+    return jsonify({'message': 'Training job queued', 'job_id': job.id, 'status_url': f'/jobs/{job.id}'}), 202
 
-    X_train, X_test, y_train, y_test = train_test_split(np.array(features), np.array(labels), test_size=0.2, random_state=42)
-    is_ai_music = label == 1
-    model_path = train_model(X_train, y_train, X_test, y_test, is_ai_music)
-    shutil.rmtree(folder_path)
-    return jsonify({'message': 'Training completed', 'model_path': model_path})
+# Route to query a background job
+@app.route('/jobs/<job_id>', methods=['GET'])
+@require_api_key
+def job_status(job_id):
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+# Route to cancel a background job
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@require_api_key
+def cancel_job(job_id):
+    job = training_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'message': 'Cancellation requested', 'status': job.status})
+
+# Import the heavy dependencies and load the served model ahead of the first request
+def preload(training=PRELOAD_TRAINING):
+    import librosa  # noqa: F401
+    import soundfile  # noqa: F401
+
+    # One second of silence compiles librosa's numba kernels and fills its filter caches
+    sr = FEATURE_CONFIG.sample_rate or 22050
+    features_from_signal(np.zeros(sr, dtype=np.float32), sr)
+    try:
+        classifier_model.get()
+    except FileNotFoundError:
+        pass  # Nothing trained yet
+    if training:
+        import tensorflow  # noqa: F401
+
+# Route to classify an audio file as AI-generated or human-made
+@app.route('/classify', methods=['POST'])
+@require_api_key
+def classify():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+
+    try:
+        _, feature_config = classifier_model.get()
+    except FileNotFoundError:
+        return jsonify({'error': 'No trained model available'}), 503
+
+    # Decode with the settings the model was trained with
+    try:
+        features = extract_features_from_bytes(file.read(), feature_config,
+                                               suffix=os.path.splitext(secure_filename(file.filename))[1])
+    except Exception as e:
+        return jsonify({'error': f'Could not process audio file: {e}'}), 400
+
+    try:
+        output = classifier.predict(features)
+    except ValueError as e:
+        # Rejected in submit() before it could join a batch
+        return jsonify({'error': f'Could not process audio file: {e}'}), 400
+    except FutureTimeoutError:
+        return jsonify({'error': 'Classifier is busy, try again later'}), 503
+    probability = float(output[0])
+    return jsonify({'probability_ai': probability, 'label': 'ai' if probability >= 0.5 else 'human'})
 
 # Song generation route
 @app.route('/generate', methods=['POST'])
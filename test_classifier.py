@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from classifier import NumpyModel, export_numpy_model  # noqa: E402
+from song_ai import create_model  # noqa: E402
+
+
+def _set_fixed_weights(model, seed=0):
+    # Small weights keep the sigmoid output away from saturation, where any diff would vanish
+    rng = np.random.default_rng(seed)
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if weights:
+            layer.set_weights([rng.normal(scale=0.1, size=w.shape).astype(np.float32) for w in weights])
+
+
+@pytest.mark.parametrize('is_ai_music', [False, True])
+def test_numpy_export_matches_keras(tmp_path, is_ai_music):
+    model = create_model((20,), is_ai_music=is_ai_music)
+    _set_fixed_weights(model)
+    path = str(tmp_path / 'model.npz')
+    export_numpy_model(model, path)
+
+    X = np.random.default_rng(1).normal(size=(50, 20)).astype(np.float32)
+    expected = model.predict(X, verbose=0)
+    np.testing.assert_allclose(NumpyModel.load(path).predict_on_batch(X), expected, rtol=1e-4, atol=1e-5)
+
+
+def test_numpy_export_matches_keras_with_midi_input(tmp_path):
+    model = create_model((20,), midi_shape=(8,))
+    _set_fixed_weights(model)
+    path = str(tmp_path / 'model.npz')
+    export_numpy_model(model, path)
+
+    rng = np.random.default_rng(2)
+    X = [rng.normal(size=(50, 20)).astype(np.float32), rng.normal(size=(50, 8)).astype(np.float32)]
+    expected = model.predict(X, verbose=0)
+    np.testing.assert_allclose(NumpyModel.load(path).predict_on_batch(X), expected, rtol=1e-4, atol=1e-5)
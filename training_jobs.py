@@ -0,0 +1,133 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs kept for status queries before the oldest are forgotten
+MAX_FINISHED_JOBS = 100
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation was requested."""
+
+
+class TrainingJob:
+    """State of one background job; `progress` is free-form and filled in by the job itself."""
+
+    def __init__(self, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def update(self, **progress):
+        with self._lock:
+            self.progress.update(progress)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class JobManager:
+    """
+    Runs jobs on a small thread pool so HTTP workers return immediately.
+
+    At most `max_concurrent` jobs run at once; the rest wait in the pool's
+    queue. Job state lives in this process only, so with several server
+    processes the status must be queried on the process that accepted the job.
+    """
+
+    def __init__(self, max_concurrent=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='training-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs); its return value becomes job.result."""
+        job = TrainingJob(str(uuid.uuid4()), kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested:
+            self._finish(job, 'cancelled')
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            self._finish(job, 'failed', error=f'{type(e).__name__}: {e}')
+        else:
+            self._finish(job, 'completed', result=result)
+
+    def _finish(self, job, status, result=None, error=None):
+        with job._lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+
+    def _forget_finished(self):
+        # Caller holds self._lock
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Request cancellation; queued jobs never start, running jobs stop at their next check."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job._cancel.set()
+        return job
+
+
+def keras_progress_callback(job):
+    """Keras callback reporting epoch and metrics to `job` and stopping training on cancel."""
+    import tensorflow as tf
+
+    class JobProgress(tf.keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            metrics = {name: float(value) for name, value in (logs or {}).items()}
+            job.update(stage='training', epoch=epoch + 1, epochs=self.params.get('epochs'), **metrics)
+            if job.cancel_requested:
+                self.model.stop_training = True
+
+    return JobProgress()
@@ -1,11 +1,12 @@
 import music21 as m21
-import random
+from trumpet_random import new_rng, pick
 from magenta.music import midi_io, sequences_lib
 
-def create_harmonious_random_trumpet_chords():
+def create_harmonious_random_trumpet_chords(seed=None):
     """
     Erstellt eine Partitur mit zufälligen, harmonisch passenden dreistimmigen Akkorden für drei Trompeten.
     """
+    rng = new_rng(seed)
     score = m21.stream.Score()
     trumpet_parts = []
     for _ in range(3):  # Simuliere 3 Trompeten für dreistimmige Akkorde
@@ -19,8 +20,8 @@ def create_harmonious_random_trumpet_chords():
     possible_lengths = [1, 1.5, 2, 3]  # Halbe, Viertel, Ganze Noten etc.
 
     for _ in range(64):  # 64 Akkorde erzeugen
-        root_note = random.choice(possible_notes)
-        chord_type = random.choice(['major', 'minor'])
+        root_note = pick(rng, possible_notes)
+        chord_type = pick(rng, ['major', 'minor'])
         if chord_type == 'major':
             intervals = ['P1', 'M3', 'P5']
         else:
@@ -31,7 +32,7 @@ def create_harmonious_random_trumpet_chords():
             for interval in intervals
         ]
 
-        note_length = random.choice(possible_lengths)
+        note_length = pick(rng, possible_lengths)
         for i, trumpet_part in enumerate(trumpet_parts):
             note = m21.note.Note(chord_pitches[i], quarterLength=note_length)
             trumpet_part.append(note)
@@ -41,10 +42,11 @@ def create_harmonious_random_trumpet_chords():
 
     return score
 
-def create_algorithmic_trumpet_chords():
+def create_algorithmic_trumpet_chords(seed=None):
     """
     Erstellt eine Partitur mit algorithmisch generierten dreistimmigen Akkorden für drei Trompeten.
     """
+    rng = new_rng(seed)
     score = m21.stream.Score()
     trumpet_parts = []
     for _ in range(3):  # Simuliere 3 Trompeten für dreistimmige Akkorde
@@ -60,7 +62,7 @@ def create_algorithmic_trumpet_chords():
     for _ in range(64):  # 64 Akkorde erzeugen
         chord_intervals = ['P1', 'M3', 'P5']
         chord_notes = [root_note.transpose(m21.interval.Interval(interval)) for interval in chord_intervals]
-        note_length = random.choice(possible_lengths2)
+        note_length = pick(rng, possible_lengths2)
 
         for i, trumpet_part in enumerate(trumpet_parts):
             note = m21.note.Note(chord_notes[i], quarterLength=note_length)
@@ -1,7 +1,8 @@
 import music21 as m21
-import random
+from trumpet_random import new_rng, pick
 
-def create_random_trumpet_score():
+def create_random_trumpet_score(seed=None):
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -14,8 +15,8 @@ def create_random_trumpet_score():
     possible_notes = ['C4', 'D4', 'E4', 'F4', 'G4', 'A4', 'B4', 'C5']  # Bereich der möglichen Noten
 
     for _ in range(64):  # Erstellen von 8 zufälligen Noten
-        note_name = random.choice(possible_notes)
-        note_length = random.choice([0.5, 1, 1.5, 2])  # Zufällige Dauer (Halbe, Ganze, usw.)
+        note_name = pick(rng, possible_notes)
+        note_length = pick(rng, [0.5, 1, 1.5, 2])  # Zufällige Dauer (Halbe, Ganze, usw.)
         note = m21.note.Note(note_name, quarterLength=note_length)
         notes.append(note)
 
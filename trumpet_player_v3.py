@@ -1,7 +1,8 @@
 import music21 as m21
-import random
+from trumpet_random import new_rng, pick
 
-def create_random_trumpet_score():
+def create_random_trumpet_score(seed=None):
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -20,8 +21,8 @@ def create_random_trumpet_score():
     notes = []
 
     for _ in range(128):  # Erstellen von 16 zufälligen Noten
-        note_name = random.choice(possible_notes)
-        note_length = random.choice(possible_lengths)
+        note_name = pick(rng, possible_notes)
+        note_length = pick(rng, possible_lengths)
         note = m21.note.Note(note_name, quarterLength=note_length)
         notes.append(note)
 
@@ -34,7 +35,8 @@ def create_random_trumpet_score():
 
     return score
 
-def create_algorithmic_trumpet_score():
+def create_algorithmic_trumpet_score(seed=None):
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -51,9 +53,9 @@ def create_algorithmic_trumpet_score():
 
     for i in range(16):  # 16 Noten erzeugen
         new_note = m21.note.Note(start_note)
-        new_note.quarterLength = random.choice(possible_lengths)
+        new_note.quarterLength = pick(rng, possible_lengths)
         notes.append(new_note)
-        start_note = start_note.transpose(random.choice([1, 2, 3]))  # Erhöhen der Tonhöhe um eine Sekunde, Terz oder andere Intervalle
+        start_note = start_note.transpose(pick(rng, [1, 2, 3]))  # Erhöhen der Tonhöhe um eine Sekunde, Terz oder andere Intervalle
 
     # Noten zum Trompetenpart hinzufügen
     for n in notes:
@@ -1,7 +1,8 @@
 import music21 as m21
-import random
+from trumpet_random import new_rng, pick, pick_distinct
 
-def create_random_trumpet_chords():
+def create_random_trumpet_chords(seed=None):
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -25,8 +26,8 @@ def create_random_trumpet_chords():
     possible_lengths = [1, 1.5, 2, 3] # Halbe-, Viertel-, Ganze Noten etc. [0.5, 1, 1.5, 2]
 
     for _ in range(64):  # 8 Akkorde erzeugen
-        chord_notes = random.sample(possible_notes, 3)  # Wähle 3 zufällige Noten für einen Akkord
-        note_length = random.choice(possible_lengths)
+        chord_notes = pick_distinct(rng, possible_notes, 3)  # Wähle 3 zufällige Noten für einen Akkord
+        note_length = pick(rng, possible_lengths)
 
         # Jeder Trompetenpart spielt eine Note des Akkords
         for i, trumpet_part in enumerate(trumpet_parts):
@@ -39,7 +40,8 @@ def create_random_trumpet_chords():
 
     return score
 
-def create_algorithmic_trumpet_chords():
+def create_algorithmic_trumpet_chords(seed=None):
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -60,7 +62,7 @@ def create_algorithmic_trumpet_chords():
         # Akkordbasis und Intervalle festlegen (Terz- und Quintabstände für Dur-Akkord)
         chord_intervals = [m21.interval.Interval('P1'), m21.interval.Interval('M3'), m21.interval.Interval('P5')]
         chord_notes = [root_note.transpose(interval) for interval in chord_intervals]
-        note_length = random.choice(possible_lengths2)
+        note_length = pick(rng, possible_lengths2)
 
         # Jeder Trompetenpart spielt eine Note des Akkords
         for j, trumpet_part in enumerate(trumpet_parts):
@@ -1,10 +1,11 @@
 import music21 as m21
-import random
+from trumpet_random import new_rng, pick, pick_distinct
 
-def create_random_trumpet_chords():
+def create_random_trumpet_chords(seed=None):
     """
     Erstellt eine Partitur mit zufälligen dreistimmigen Akkorden für drei Trompeten.
     """
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -28,8 +29,8 @@ def create_random_trumpet_chords():
     possible_lengths = [1, 1.5, 2, 3]  # Halbe, Viertel, Ganze Noten etc.
 
     for _ in range(64):  # 64 Akkorde erzeugen
-        chord_notes = random.sample(possible_notes, 3)  # Wähle 3 zufällige Noten
-        note_length = random.choice(possible_lengths)
+        chord_notes = pick_distinct(rng, possible_notes, 3)  # Wähle 3 zufällige Noten
+        note_length = pick(rng, possible_lengths)
 
         # Jeder Trompetenpart spielt eine Note des Akkords
         for i, trumpet_part in enumerate(trumpet_parts):
@@ -42,10 +43,11 @@ def create_random_trumpet_chords():
 
     return score
 
-def create_algorithmic_trumpet_chords():
+def create_algorithmic_trumpet_chords(seed=None):
     """
     Erstellt eine Partitur mit algorithmisch generierten dreistimmigen Akkorden für drei Trompeten.
     """
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -70,7 +72,7 @@ def create_algorithmic_trumpet_chords():
             m21.interval.Interval('P5')   # Perfekte Quinte
         ]
         chord_notes = [root_note.transpose(interval) for interval in chord_intervals]
-        note_length = random.choice(possible_lengths2)
+        note_length = pick(rng, possible_lengths2)
 
         # Jeder Trompetenpart spielt eine Note des Akkords
         for i, trumpet_part in enumerate(trumpet_parts):
@@ -1,10 +1,11 @@
 import music21 as m21
-import random
+from trumpet_random import new_rng, pick
 
-def create_harmonious_random_trumpet_chords():
+def create_harmonious_random_trumpet_chords(seed=None):
     """
     Erstellt eine Partitur mit zufälligen, harmonisch passenden dreistimmigen Akkorden für drei Trompeten.
     """
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -27,10 +28,10 @@ def create_harmonious_random_trumpet_chords():
 
     for _ in range(64):  # 64 Akkorde erzeugen
         # Wähle eine zufällige Stufe der Tonleiter als Akkordbasis
-        root_note = random.choice(possible_notes)
+        root_note = pick(rng, possible_notes)
 
         # Generiere einen Dur- oder Moll-Akkord aus der Tonleiter
-        chord_type = random.choice(['major', 'minor'])  # Dur oder Moll
+        chord_type = pick(rng, ['major', 'minor'])  # Dur oder Moll
         if chord_type == 'major':
             intervals = ['P1', 'M3', 'P5']  # Grundton, große Terz, Quinte
         else:
@@ -41,7 +42,7 @@ def create_harmonious_random_trumpet_chords():
             for interval in intervals
         ]
 
-        note_length = random.choice(possible_lengths)
+        note_length = pick(rng, possible_lengths)
 
         # Jeder Trompetenpart spielt eine Note des Akkords
         for i, trumpet_part in enumerate(trumpet_parts):
@@ -55,10 +56,11 @@ def create_harmonious_random_trumpet_chords():
     return score
 
 
-def create_algorithmic_trumpet_chords():
+def create_algorithmic_trumpet_chords(seed=None):
     """
     Erstellt eine Partitur mit algorithmisch generierten dreistimmigen Akkorden für drei Trompeten.
     """
+    rng = new_rng(seed)
     # Erstellen einer neuen Partitur
     score = m21.stream.Score()
 
@@ -85,7 +87,7 @@ def create_algorithmic_trumpet_chords():
             m21.interval.Interval('P5')   # Perfekte Quinte
         ]
         chord_notes = [root_note.transpose(interval) for interval in chord_intervals]
-        note_length = random.choice(possible_lengths2)
+        note_length = pick(rng, possible_lengths2)
 
         # Jeder Trompetenpart spielt eine Note des Akkords
         for i, trumpet_part in enumerate(trumpet_parts):
@@ -0,0 +1,18 @@
+import numpy as np
+
+# Gemeinsame Zufallshilfen der trumpet_player-Skripte
+
+
+def new_rng(seed=None):
+    """Eigener Zufallsgenerator pro Partitur; gleicher seed ergibt dieselbe Partitur."""
+    return np.random.default_rng(seed)
+
+
+def pick(rng, options):
+    """Ein Element wie random.choice; das Element der Liste selbst (kein numpy-Skalar), damit music21 dieselben Typen bekommt."""
+    return options[rng.integers(len(options))]
+
+
+def pick_distinct(rng, options, k):
+    """k verschiedene Elemente, wie random.sample."""
+    return [options[i] for i in rng.choice(len(options), size=k, replace=False)]
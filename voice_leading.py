@@ -0,0 +1,177 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+from chord_engine import (BATCH_BLOCK, CHORD_TYPES, N_CHORD_STATES, STATE_BY_MASK, STEP_SEMITONES, ChordBatch,
+                          _parse_tonic, chord_state, voicing_table)
+
+# Kosten für leere Kandidaten; groß genug, dass kein echter Pfad sie erreicht, und ohne Überlauf in int32
+UNREACHABLE = 1 << 28
+
+# Akkorde pro Durchlauf von best_voicings; dessen Zwischenspeicher wächst mit Folgen * Länge
+# (etwa 23 MiB für BATCH_BLOCK Folgen zu 64 Akkorden), deshalb in Akkorden statt Folgen bemessen
+VOICE_LEAD_CHORDS = BATCH_BLOCK * 64
+
+# Bequemer klingender Umfang je Trompete, von der tiefsten Stimme (3. Trompete) zur höchsten (1. Trompete)
+TRUMPET_RANGES = ((52, 74), (55, 77), (58, 82))
+
+
+@dataclass(frozen=True)
+class CandidateTable:
+    """
+    Kandidaten-Voicings pro Akkordzustand einer Tonart und die Kosten aller Übergänge.
+
+    `rows` (Zustände, K) sind Zeilen der VoicingTable, deren Stimmen in den
+    Umfängen liegen (-1 = leer), `pitches` (Zustände, K, Stimmen) ihre
+    Tonhöhen. `costs` (K, K, Zustände, Zustände) ist die Summe der
+    Halbtonschritte aller Stimmen von Kandidat i des ersten zu Kandidat j des
+    zweiten Zustands (int32); leere Kandidaten kosten UNREACHABLE. Die
+    Kandidatenachsen stehen vorn, so liest best_voicings alle Übergänge einer
+    Folge mit einem take pro Kandidatenpaar.
+    """
+    key: str
+    rows: np.ndarray
+    pitches: np.ndarray
+    costs: np.ndarray
+
+
+@lru_cache(maxsize=None)
+def candidate_table(key='C', ranges=TRUMPET_RANGES):
+    """CandidateTable für Tonart und Umfänge, einmal pro Kombination berechnet."""
+    table = voicing_table(key)
+    low = np.array([voice_range[0] for voice_range in ranges])
+    high = np.array([voice_range[1] for voice_range in ranges])
+    inside = ((table.pitches >= low) & (table.pitches <= high)).all(axis=1)
+
+    counts = np.bincount(table.states[inside], minlength=N_CHORD_STATES)
+    if counts.min() == 0:
+        missing = int(np.argmin(counts))
+        raise ValueError(f'No voicing of chord state {missing} fits the ranges {ranges}')
+    # Kandidaten jedes Zustands nach vorn, Rest mit -1 auffüllen
+    indices = np.flatnonzero(inside)
+    position = np.arange(len(indices)) - np.searchsorted(table.states[indices], table.states[indices])
+    rows = np.full((N_CHORD_STATES, counts.max()), -1, dtype=np.int64)
+    rows[table.states[indices], position] = indices
+
+    valid = rows >= 0
+    pitches = np.where(valid[..., None], table.pitches[rows].astype(np.int64), 0)
+    steps = np.abs(pitches[:, None, :, None, :] - pitches[None, :, None, :, :]).sum(axis=-1)
+    costs = np.where(valid[:, None, :, None] & valid[None, :, None, :], steps, UNREACHABLE).astype(np.int32)
+    costs = np.ascontiguousarray(costs.transpose(2, 3, 0, 1))
+    for array in (rows, pitches, costs):
+        array.setflags(write=False)
+    return CandidateTable(key=key, rows=rows, pitches=pitches, costs=costs)
+
+
+def chord_states_in_key(pitches, key='C'):
+    """Akkordzustände (relativ zur Tonika von `key`) für Akkorde (..., Stimmen); -1, wo kein Dreiklang klingt."""
+    letter, alter = _parse_tonic(key)
+    tonic = (STEP_SEMITONES[letter] + alter) % 12
+    masks = np.bitwise_or.reduce(1 << (np.asarray(pitches, dtype=np.int64) % 12), axis=-1)
+    absolute = STATE_BY_MASK[masks].astype(np.int64)
+    n_types = len(CHORD_TYPES)
+    relative = chord_state((absolute // n_types - tonic) % 12, absolute % n_types)
+    return np.where(absolute >= 0, relative, -1)
+
+
+def _min_plus(left, right):
+    # Min-Plus-Produkt gestapelter Matrizen (K, K, ...). K ist klein: eine Schleife über den
+    # mittleren Index mit ganzen Ebenen pro Schritt ist deutlich schneller als min über eine
+    # kurze Achse.
+    product = left[:, 0, None] + right[None, 0]
+    total = np.empty_like(product)
+    for m in range(1, left.shape[1]):
+        np.add(left[:, m, None], right[None, m], out=total)
+        np.minimum(product, total, out=product)
+    return np.minimum(product, UNREACHABLE, out=product)
+
+
+def best_voicings(states, key='C', ranges=TRUMPET_RANGES):
+    """
+    Kandidatenindizes (Folgen, Länge) mit minimaler Summe aller Stimmbewegungen, für Zustände (Folgen, Länge).
+
+    Viterbi über die ganze Folge: die Übergangskosten kommen fertig aus der
+    CandidateTable, die Rekursion wird als Min-Plus-Produkt der
+    Übergangsmatrizen paarweise in einem balancierten Baum gerechnet, jede
+    Ebene vektorisiert über alle Folgen und Positionen. Der Aufwand ist linear
+    in der Länge; der optimale Pfad wird von oben nach unten aus den
+    gespeicherten Ebenen zurückgelesen.
+    """
+    candidates = candidate_table(key, ranges)
+    states = np.asarray(states, dtype=np.int64)
+    n_sequences, length = states.shape
+    size = candidates.rows.shape[1]
+    if length < 2:
+        return np.zeros((n_sequences, length), dtype=np.int64)
+
+    # Übergangsmatrizen als (K, K, Position, Folge), damit die Schleifen in numpy über
+    # Positionen und Folgen laufen; auf eine Zweierpotenz mit neutralen Elementen
+    # (0 diagonal, sonst UNREACHABLE) aufgefüllt
+    n_nodes = 1 << (length - 2).bit_length()
+    identity = np.where(np.eye(size, dtype=bool), 0, UNREACHABLE).astype(np.int32)
+    matrices = np.empty((size, size, n_nodes, n_sequences), dtype=np.int32)
+    matrices[:, :, length - 1:] = identity[:, :, None, None]
+    transitions = (states[:, :-1] * N_CHORD_STATES + states[:, 1:]).T
+    by_pair = candidates.costs.reshape(size, size, -1)
+    for i in range(size):
+        for j in range(size):
+            by_pair[i, j].take(transitions, out=matrices[i, j, :length - 1])
+    levels = []
+    while matrices.shape[2] > 1:
+        levels.append(matrices)
+        matrices = _min_plus(matrices[:, :, 0::2], matrices[:, :, 1::2])
+
+    # Bester Anfangs- und Endkandidat; dann pro Ebene den Mittelpunkt jedes Knotens aus den
+    # beiden Kindern bestimmen, nur für das gewählte Paar (Anfang, Ende)
+    flat = matrices.reshape(size * size, n_sequences).argmin(axis=0)
+    starts, stops = (flat // size)[None], (flat % size)[None]  # (Knoten, Folge)
+    sequence = np.arange(n_sequences)[None]
+    for children in reversed(levels):
+        nodes = np.arange(len(starts))[:, None]
+        left = children[starts, :, 2 * nodes, sequence]  # (Knoten, Folge, K)
+        right = children[:, stops, 2 * nodes + 1, sequence]  # (K, Knoten, Folge)
+        mid = (left + np.moveaxis(right, 0, -1)).argmin(axis=-1)
+        starts = np.stack([starts, mid], axis=1).reshape(-1, n_sequences)
+        stops = np.stack([mid, stops], axis=1).reshape(-1, n_sequences)
+    path = np.concatenate([starts, stops[-1:]])
+    return path[:length].T.astype(np.int64)
+
+
+def voice_lead_batch(batch, key='C', ranges=TRUMPET_RANGES):
+    """
+    Setzt die Akkorde einer ChordBatch mit minimaler Stimmbewegung neu, Dauern bleiben.
+
+    Jeder Akkord wird über seine Tonklassen einem Zustand der Tonart zugeordnet
+    und auf eines seiner Voicings innerhalb der Umfänge (Stimme i in
+    ranges[i]) gelegt. Akkorde, die kein Dreiklang aus CHORD_TYPES sind,
+    ergeben einen ValueError. Die Folgen werden in Stücken von höchstens
+    VOICE_LEAD_CHORDS Akkorden gesetzt, so bleibt der Speicherbedarf auch
+    für große Batches beschränkt.
+    """
+    states = chord_states_in_key(batch.pitches, key)
+    if (states < 0).any():
+        raise ValueError('Voice leading needs triads from CHORD_TYPES in every chord')
+    candidates = candidate_table(key, ranges)
+    table = voicing_table(key)
+    n_sequences, length = states.shape
+    pitches = np.empty(states.shape + table.pitches.shape[1:], dtype=table.pitches.dtype)
+    steps = np.empty(states.shape + table.steps.shape[1:], dtype=table.steps.dtype)
+    per_slice = max(1, VOICE_LEAD_CHORDS // max(length, 1))
+    for first in range(0, n_sequences, per_slice):
+        part = states[first:first + per_slice]
+        rows = candidates.rows[part, best_voicings(part, key, ranges)]
+        pitches[first:first + per_slice] = table.pitches[rows]
+        steps[first:first + per_slice] = table.steps[rows]
+    return ChordBatch(pitches=pitches, steps=steps, durations=batch.durations)
+
+
+def voice_lead(sequence, key='C', ranges=TRUMPET_RANGES):
+    """voice_lead_batch für eine einzelne ChordSequence."""
+    batch = ChordBatch(pitches=sequence.pitches[None], steps=sequence.steps[None], durations=sequence.durations[None])
+    return voice_lead_batch(batch, key, ranges)[0]
+
+
+def voice_movement(pitches):
+    """Summe der Halbtonschritte aller Stimmen zwischen aufeinanderfolgenden Akkorden, pro Folge (..., Akkorde, Stimmen)."""
+    return np.abs(np.diff(np.asarray(pitches, dtype=np.int64), axis=-2)).sum(axis=(-2, -1))
@@ -0,0 +1,238 @@
+import hashlib
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_features import AUDIO_EXTENSIONS, DEFAULT_FEATURE_CONFIG, FEATURE_SIZE, extract_features_from_bytes
+
+# Limits applied before anything is decompressed (declared sizes) and while
+# reading (actual bytes), to reject zip bombs and oversized uploads
+MAX_ENTRIES = 10000
+MAX_MEMBER_BYTES = 512 * 1024 * 1024
+MAX_TOTAL_BYTES = 4 * 1024 * 1024 * 1024
+MAX_COMPRESSION_RATIO = 100
+
+# Bytes copied per read when extracting a member to disk
+COPY_BLOCK_SIZE = 1 << 20
+
+# Written instead of audio files when an upload is featurized in memory
+FEATURES_FILE = 'features.npz'
+
+
+class ZipLimitError(ValueError):
+    """The archive is malformed or exceeds one of the ingestion limits."""
+
+
+def _is_audio_member(info):
+    name = os.path.basename(info.filename)
+    return (
+        not info.is_dir()
+        and name
+        and not name.startswith('.')
+        and not info.filename.startswith('__MACOSX/')
+        and name.lower().endswith(AUDIO_EXTENSIONS)
+    )
+
+
+def audio_members(fileobj):
+    """
+    Open the zip in `fileobj` in place and return (zip, audio member infos).
+
+    The archive is read in place from the upload stream, so this code makes no
+    copy of it; werkzeug itself spools uploads over 500 KB to a temporary file
+    before the request handler sees them. Only the central directory is
+    inspected here; entry count, declared sizes and compression ratios are
+    checked before any member is inflated.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ZipLimitError(f'Invalid zip file: {e}')
+
+    infos = archive.infolist()
+    if len(infos) > MAX_ENTRIES:
+        raise ZipLimitError(f'Zip has {len(infos)} entries, limit is {MAX_ENTRIES}')
+
+    members = [info for info in infos if _is_audio_member(info)]
+    total = 0
+    for info in members:
+        if info.file_size > MAX_MEMBER_BYTES:
+            raise ZipLimitError(f'{info.filename} is larger than {MAX_MEMBER_BYTES} bytes')
+        if info.compress_size and info.file_size / info.compress_size > MAX_COMPRESSION_RATIO:
+            raise ZipLimitError(f'{info.filename} exceeds the compression ratio limit')
+        total += info.file_size
+    if total > MAX_TOTAL_BYTES:
+        raise ZipLimitError(f'Audio in zip exceeds {MAX_TOTAL_BYTES} bytes uncompressed')
+    return archive, members
+
+
+def _copy_member(archive, info, target):
+    # Count actual bytes as well: the declared size is only a claim
+    copied = 0
+    with archive.open(info) as source:
+        for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b''):
+            copied += len(block)
+            if copied > MAX_MEMBER_BYTES:
+                raise ZipLimitError(f'{info.filename} is larger than {MAX_MEMBER_BYTES} bytes')
+            target.write(block)
+    return copied
+
+
+def _unique_name(name, used):
+    # Members are flattened into one folder; keep same-named files from different subfolders
+    base, ext = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in used:
+        candidate = f'{base}_{counter}{ext}'
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def extract_audio(fileobj, dest_dir):
+    """
+    Write only the audio members of the zip in `fileobj` into `dest_dir`.
+
+    Member paths are flattened to their base name, so entries like
+    '../../etc/passwd' cannot escape `dest_dir`. Returns the written paths.
+    """
+    archive, members = audio_members(fileobj)
+    os.makedirs(dest_dir, exist_ok=True)
+    used = set(os.listdir(dest_dir))
+    paths = []
+    with archive:
+        for info in members:
+            path = os.path.join(dest_dir, _unique_name(os.path.basename(info.filename), used))
+            try:
+                with open(path, 'wb') as target:
+                    _copy_member(archive, info, target)
+            except BaseException:
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+            paths.append(path)
+    return paths
+
+
+def _suffix(info):
+    # File extension of a member, for decoders that go by the name
+    return os.path.splitext(info.filename)[1].lower()
+
+
+def _features_or_error(data, config, suffix=''):
+    try:
+        return extract_features_from_bytes(data, config, suffix), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+def featurize_audio(fileobj, config=DEFAULT_FEATURE_CONFIG, workers=1, cache=None):
+    """
+    Extract features from the audio members of the zip in `fileobj` without writing them to disk.
+
+    Each member is inflated into memory (bounded by MAX_MEMBER_BYTES) and handed to
+    extract_features. With workers > 1 up to 2 * workers members of up to
+    MAX_MEMBER_BYTES (512 MB) each are held in memory during the request, plus
+    their copies in the worker processes. Returns (names, features, errors) in
+    archive order.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    archive, members = audio_members(fileobj)
+    results = [None] * len(members)
+    keys = [None] * len(members)
+
+    def read(info):
+        buffer = io.BytesIO()
+        _copy_member(archive, info, buffer)
+        return buffer.getvalue()
+
+    with archive:
+        if workers <= 1:
+            for i, info in enumerate(members):
+                data = read(info)
+                results[i], keys[i] = _cached_or_extract(data, config, cache, _suffix(info))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                in_flight = {}
+                for i, info in enumerate(members):
+                    data = read(info)
+                    result, keys[i] = _cached_or_lookup(data, config, cache)
+                    if result is not None:
+                        results[i] = result
+                        continue
+                    in_flight[i] = executor.submit(_features_or_error, data, config, _suffix(info))
+                    if len(in_flight) >= 2 * workers:
+                        _drain(in_flight, results, wait_for=1)
+                _drain(in_flight, results)
+
+    if cache is not None:
+        for key, (vector, error) in zip(keys, results):
+            if key is not None and error is None:
+                cache.put(key, vector)
+
+    names = []
+    features = []
+    errors = []
+    for info, (vector, error) in zip(members, results):
+        if error is None:
+            names.append(info.filename)
+            features.append(vector)
+        else:
+            errors.append((info.filename, error))
+    return names, features, errors
+
+
+def _cached_or_lookup(data, config, cache):
+    # (cached result or None, cache key to store a fresh result under)
+    if cache is None:
+        return None, None
+    key = cache.key_for(hashlib.sha256(data).hexdigest(), config.tag())
+    vector = cache.get(key)
+    if vector is not None:
+        return (vector, None), None
+    return None, key
+
+
+def _cached_or_extract(data, config, cache, suffix=''):
+    result, key = _cached_or_lookup(data, config, cache)
+    if result is None:
+        result = _features_or_error(data, config, suffix)
+    return result, key
+
+
+def _drain(in_flight, results, wait_for=None):
+    # Collect finished futures in submission order; stop after `wait_for` results
+    collected = 0
+    for i in sorted(in_flight):
+        results[i] = in_flight.pop(i).result()
+        collected += 1
+        if wait_for is not None and collected >= wait_for:
+            return
+
+
+def save_feature_file(dest_dir, names, features, config):
+    os.makedirs(dest_dir, exist_ok=True)
+    matrix = np.asarray(features, dtype=np.float32).reshape(-1, FEATURE_SIZE)
+    np.savez(os.path.join(dest_dir, FEATURES_FILE), names=np.asarray(names, dtype=str), features=matrix,
+             config_tag=np.asarray(config.tag()))
+
+
+def load_feature_file(folder, config):
+    """
+    Features saved by save_feature_file in `folder`, or None if there are none.
+
+    Raises ValueError if they were extracted with a different FeatureConfig.
+    """
+    path = os.path.join(folder, FEATURES_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if str(data['config_tag']) != config.tag():
+            raise ValueError('Features in this folder were extracted with different settings')
+        return list(data['features'])